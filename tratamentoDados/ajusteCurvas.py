@@ -0,0 +1,331 @@
+# Tratamento de Dados - Um exemplo de projeto Python
+# Copyright (C) 2024 Vinicius Patriarca Miranda Miguel
+
+# Este programa é software livre: você pode redistribuí-lo e/ou modificá-lo
+# sob os termos da Licença Pública Geral GNU como publicada pela Free Software
+# Foundation, tanto a versão 3 da Licença, como (a seu critério) qualquer versão posterior.
+
+# Este programa é distribuído na esperança de que seja útil,
+# mas SEM NENHUMA GARANTIA; sem mesmo a garantia implícita de
+# COMERCIABILIDADE ou ADEQUAÇÃO A UM DETERMINADO FIM. Veja a
+# Licença Pública Geral GNU para mais detalhes.
+
+# Você deve ter recebido uma cópia da Licença Pública Geral GNU
+# junto com este programa. Se não, veja <https://www.gnu.org/licenses/>.
+
+import argparse
+import glob
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from scipy.interpolate import BSpline
+
+import leituraSerie
+from cacheDependencias import (
+    DependencyCache,
+    add_force_argument,
+    code_version,
+    config_hash,
+)
+from leituraSerie import elapsed_hours, parse_time
+
+AJUSTES_VERSION = 2
+
+TIPOS = ("polinomio", "spline")
+GRAU_PADRAO = 5
+NOS_PADRAO = 10
+
+# Grau dos polinômios de cada trecho das splines (cúbicas)
+GRAU_SPLINE = 3
+
+
+def model_key(tipo="polinomio", grau=GRAU_PADRAO, nos=NOS_PADRAO):
+    # Identificador do modelo no arquivo de ajustes, por exemplo "polinomio-5"
+    if tipo not in TIPOS:
+        raise ValueError(f"Tipo de ajuste desconhecido: {tipo}")
+    return f"{tipo}-{grau if tipo == 'polinomio' else nos}"
+
+
+def load_hours_series(input_file):
+    # Série de um CSV como (horas desde o início, valores), sem valores
+    # inválidos e em ordem de tempo, ou None se o arquivo não tiver as colunas
+    # esperadas
+    data = pd.read_csv(input_file)
+    if data.shape[1] < 2:
+        return None
+
+    times = elapsed_hours(parse_time(data["data"])).to_numpy(dtype=float)
+    values = pd.to_numeric(data[data.columns[1]], errors="coerce").to_numpy(dtype=float)
+    valid = ~np.isnan(values) & ~np.isnan(times)
+    order = np.argsort(times[valid], kind="stable")
+    return times[valid][order], values[valid][order]
+
+
+def normalize_times(times):
+    # Leva os tempos para [-1, 1], o que mantém o ajuste bem condicionado
+    centro = (times.max() + times.min()) / 2
+    escala = (times.max() - times.min()) / 2 or 1.0
+    return (times - centro) / escala, float(centro), float(escala)
+
+
+def _stack(series):
+    # Concatena as séries normalizadas, com o índice da série de cada ponto
+    normalized = [normalize_times(times) for times, _ in series]
+    u = np.concatenate([n[0] for n in normalized])
+    y = np.concatenate([values for _, values in series])
+    counts = np.array([len(values) for _, values in series])
+    sid = np.repeat(np.arange(len(series)), counts)
+    offsets = np.r_[0, np.cumsum(counts)[:-1]]
+    return u, y, sid, offsets, counts, normalized
+
+
+def _solve(normal, rhs):
+    # Resolve as equações normais de todas as séries em uma única chamada. A
+    # pseudo-inversa dá a solução de norma mínima quando a série tem menos
+    # pontos que parâmetros.
+    return np.einsum("sij,sj->si", np.linalg.pinv(normal), rhs)
+
+
+def _diagnostics(y, fitted, sid, counts):
+    # Resíduo (raiz do erro quadrático médio) e R² de cada série
+    n_series = len(counts)
+    ss_res = np.bincount(sid, weights=(y - fitted) ** 2, minlength=n_series)
+    means = np.bincount(sid, weights=y, minlength=n_series) / counts
+    ss_tot = np.bincount(sid, weights=(y - means[sid]) ** 2, minlength=n_series)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r2 = np.where(ss_tot > 0, 1 - ss_res / ss_tot, np.nan)
+    return np.sqrt(ss_res / counts), r2
+
+
+def fit_polynomials(series, grau=GRAU_PADRAO):
+    # Ajusta um polinômio de grau 'grau' a cada série [(tempos, valores), ...]
+    # por mínimos quadrados. As equações normais vêm de somas de potências
+    # calculadas de uma vez para todas as séries.
+    u, y, sid, offsets, counts, normalized = _stack(series)
+
+    potencias = u[:, None] ** np.arange(2 * grau + 1)
+    somas = np.add.reduceat(potencias, offsets, axis=0)
+    momentos = np.add.reduceat(potencias[:, : grau + 1] * y[:, None], offsets, axis=0)
+
+    # Coeficientes em ordem decrescente de potência, como em np.polyval
+    expoentes = grau - np.arange(grau + 1)
+    normal = somas[:, expoentes[:, None] + expoentes[None, :]]
+    coeficientes = _solve(normal, momentos[:, expoentes])
+
+    fitted = np.zeros_like(u)
+    for coluna in range(grau + 1):
+        fitted = fitted * u + coeficientes[sid, coluna]
+    rms, r2 = _diagnostics(y, fitted, sid, counts)
+
+    return [
+        {
+            "tipo": "polinomio",
+            "grau": grau,
+            "centro": centro,
+            "escala": escala,
+            "coeficientes": coeficientes[i].tolist(),
+            "n": int(counts[i]),
+            "residuo": float(rms[i]),
+            "r2": float(r2[i]),
+        }
+        for i, (_, centro, escala) in enumerate(normalized)
+    ]
+
+
+def spline_knots(nos=NOS_PADRAO, grau=GRAU_SPLINE):
+    # Vetor de nós de uma spline com 'nos' nós internos uniformes em [-1, 1]
+    internos = np.linspace(-1, 1, nos + 2)[1:-1]
+    return np.r_[[-1.0] * (grau + 1), internos, [1.0] * (grau + 1)]
+
+
+def fit_splines(series, nos=NOS_PADRAO, grau=GRAU_SPLINE):
+    # Ajusta a cada série uma spline de mínimos quadrados com 'nos' nós
+    # internos, que acompanha vários picos de chuva em uma mesma série. Como
+    # os tempos estão normalizados, todas as séries usam os mesmos nós e uma
+    # única matriz de projeto.
+    u, y, sid, offsets, counts, normalized = _stack(series)
+    knots = spline_knots(nos, grau)
+
+    projeto = BSpline.design_matrix(u, knots, grau).tocsr()
+    limites = np.r_[offsets, len(u)]
+    normal = np.stack(
+        [
+            (projeto[a:b].T @ projeto[a:b]).toarray()
+            for a, b in zip(limites[:-1], limites[1:])
+        ]
+    )
+    rhs = np.stack([projeto[a:b].T @ y[a:b] for a, b in zip(limites[:-1], limites[1:])])
+    coeficientes = _solve(normal, rhs)
+
+    fitted = np.asarray(projeto.multiply(coeficientes[sid]).sum(axis=1)).ravel()
+    rms, r2 = _diagnostics(y, fitted, sid, counts)
+
+    return [
+        {
+            "tipo": "spline",
+            "grau": grau,
+            "nos": knots.tolist(),
+            "centro": centro,
+            "escala": escala,
+            "coeficientes": coeficientes[i].tolist(),
+            "n": int(counts[i]),
+            "residuo": float(rms[i]),
+            "r2": float(r2[i]),
+        }
+        for i, (_, centro, escala) in enumerate(normalized)
+    ]
+
+
+def fit_series(series, tipo="polinomio", grau=GRAU_PADRAO, nos=NOS_PADRAO):
+    # Ajusta o modelo escolhido a todas as séries de uma vez
+    if not series:
+        return []
+    if tipo == "spline":
+        return fit_splines(series, nos)
+    return fit_polynomials(series, grau)
+
+
+def evaluate_fit(ajuste, times, derivada=False):
+    # Valor (ou derivada em relação ao tempo, em horas) do ajuste salvo
+    u = (np.asarray(times, dtype=float) - ajuste["centro"]) / ajuste["escala"]
+    coeficientes = np.asarray(ajuste["coeficientes"])
+    if ajuste["tipo"] == "spline":
+        spline = BSpline(np.asarray(ajuste["nos"]), coeficientes, ajuste["grau"])
+        if derivada:
+            return spline.derivative()(u) / ajuste["escala"]
+        return spline(u)
+    if derivada:
+        return np.polyval(np.polyder(coeficientes), u) / ajuste["escala"]
+    return np.polyval(coeficientes, u)
+
+
+def ajustes_path(simulacao):
+    return f"simulacao{simulacao}/ajustes.json"
+
+
+def load_fits(simulacao):
+    # Ajustes salvos da simulação, como {"telhadoT/arquivo.csv": {modelo: ...}}
+    try:
+        with open(ajustes_path(simulacao), "r") as f:
+            ajustes = json.load(f)
+        if ajustes.get("versao") == AJUSTES_VERSION:
+            return ajustes["series"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return {}
+
+
+def save_fits(simulacao, ajustes):
+    # Escreve em um arquivo temporário para não deixar um arquivo incompleto
+    path = ajustes_path(simulacao)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"versao": AJUSTES_VERSION, "series": ajustes}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def fit_config(modelo):
+    # Hash do modelo e do código que produzem um ajuste
+    return config_hash(
+        {"modelo": modelo}, code_version(sys.modules[__name__], leituraSerie)
+    )
+
+
+def fit_simulation(
+    simulacao,
+    telhado=None,
+    tipo="polinomio",
+    grau=GRAU_PADRAO,
+    nos=NOS_PADRAO,
+    forcar=False,
+):
+    # Ajusta as séries da simulação (ou de um telhado) que ainda não têm um
+    # ajuste válido do modelo escolhido, todas em um único lote, e salva os
+    # resultados. Um ajuste vale enquanto o conteúdo do CSV, o modelo e o
+    # código forem os mesmos. Retorna {"telhadoT/arquivo.csv": ajuste}.
+    modelo = model_key(tipo, grau, nos)
+    config = fit_config(modelo)
+    ajustes = load_fits(simulacao)
+    telhados = f"telhado{telhado}" if telhado else "telhado*"
+    arquivos = sorted(glob.glob(f"simulacao{simulacao}/{telhados}/csv/*.csv"))
+    hashes = DependencyCache(f"simulacao{simulacao}").input_hashes(arquivos)
+
+    resultado = {}
+    pendentes = []
+    for input_file in arquivos:
+        chave = os.path.relpath(input_file, f"simulacao{simulacao}").replace(
+            os.sep + "csv" + os.sep, "/"
+        )
+        entrada = hashes[os.path.normpath(input_file)]
+        ajuste = ajustes.get(chave, {}).get(modelo)
+        if (
+            not forcar
+            and ajuste is not None
+            and ajuste.get("config") == config
+            and ajuste.get("entrada") == entrada
+        ):
+            resultado[chave] = ajuste
+        else:
+            pendentes.append((chave, input_file, entrada))
+
+    series = []
+    for chave, input_file, entrada in pendentes:
+        serie = load_hours_series(input_file)
+        if serie is not None and len(serie[0]):
+            series.append((chave, entrada, serie))
+
+    novos = fit_series([serie for _, _, serie in series], tipo, grau, nos)
+    for (chave, entrada, _), ajuste in zip(series, novos):
+        ajuste.update({"entrada": entrada, "config": config})
+        ajustes.setdefault(chave, {})[modelo] = ajuste
+        resultado[chave] = ajuste
+
+    if novos:
+        save_fits(simulacao, ajustes)
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Ajusta curvas às séries de uma simulação e salva os coeficientes"
+    )
+    parser.add_argument(
+        "--simulacao", "-s", type=str, required=True, help="Número da simulação"
+    )
+    parser.add_argument(
+        "--telhado",
+        "-t",
+        type=str,
+        help="Número do telhado (padrão: todos os telhados da simulação)",
+    )
+    parser.add_argument(
+        "--tipo", choices=TIPOS, default="polinomio", help="Tipo de ajuste"
+    )
+    parser.add_argument(
+        "--grau", type=int, default=GRAU_PADRAO, help="Grau do polinômio"
+    )
+    parser.add_argument(
+        "--nos",
+        type=int,
+        default=NOS_PADRAO,
+        help="Número de nós internos da spline",
+    )
+    add_force_argument(
+        parser, "Refaz os ajustes mesmo se já estiverem salvos e atualizados"
+    )
+
+    args = parser.parse_args()
+
+    ajustes = fit_simulation(
+        args.simulacao, args.telhado, args.tipo, args.grau, args.nos, args.forcar
+    )
+    for chave, ajuste in sorted(ajustes.items()):
+        print(f"{chave}: R² = {ajuste['r2']:.4f}, resíduo = {ajuste['residuo']:.4g}")
+    print(f"Ajustes salvos em {ajustes_path(args.simulacao)}")
+
+
+if __name__ == "__main__":
+    main()
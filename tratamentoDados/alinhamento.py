@@ -0,0 +1,242 @@
+# Tratamento de Dados - Um exemplo de projeto Python
+# Copyright (C) 2024 Vinicius Patriarca Miranda Miguel
+
+# Este programa é software livre: você pode redistribuí-lo e/ou modificá-lo
+# sob os termos da Licença Pública Geral GNU como publicada pela Free Software
+# Foundation, tanto a versão 3 da Licença, como (a seu critério) qualquer versão posterior.
+
+# Este programa é distribuído na esperança de que seja útil,
+# mas SEM NENHUMA GARANTIA; sem mesmo a garantia implícita de
+# COMERCIABILIDADE ou ADEQUAÇÃO A UM DETERMINADO FIM. Veja a
+# Licença Pública Geral GNU para mais detalhes.
+
+# Você deve ter recebido uma cópia da Licença Pública Geral GNU
+# junto com este programa. Se não, veja <https://www.gnu.org/licenses/>.
+
+import argparse
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+from leituraSerie import load_series
+from serieBinaria import SERIES_EXTENSION
+
+AGREGACOES = ("media", "ultimo", "interpolar", "soma")
+
+# Agregação padrão por tópico (primeiro trecho do nome que coincidir). A chuva
+# em milímetros e as oscilações são publicadas por intervalo de medição e por
+# isso são somadas; a contagem acumulada de oscilações (Oscilacoes/Parciais) e
+# os valores de configuração mantêm a última leitura.
+AGREGACAO_TOPICOS = (
+    ("Milimetros", "soma"),
+    ("Oscilacoes_Parciais", "ultimo"),
+    ("Oscilacoes/Parciais", "ultimo"),
+    ("Oscilacoes", "soma"),
+    ("RaioGalao", "ultimo"),
+    ("Status", "ultimo"),
+)
+AGREGACAO_PADRAO = "media"
+
+PASSO_PADRAO = 60.0
+
+
+def topic_aggregation(topic, agregacoes=None):
+    # Agregação de um tópico: a escolhida pelo usuário ou a padrão
+    for pattern, agregacao in tuple((agregacoes or {}).items()) + AGREGACAO_TOPICOS:
+        if pattern in topic:
+            return agregacao
+    return AGREGACAO_PADRAO
+
+
+def regular_grid(start, end, passo=PASSO_PADRAO):
+    # Grade regular de 'passo' segundos que cobre [start, end], começando no
+    # múltiplo de 'passo' imediatamente anterior a 'start'
+    step = np.int64(round(passo * 1e9))
+    first = np.datetime64(start, "ns").astype(np.int64) // step * step
+    last = np.datetime64(end, "ns").astype(np.int64)
+    return np.arange(first, last + 1, step).astype("datetime64[ns]")
+
+
+def asof_join(grid, times, values, tolerancia=None):
+    # Para cada instante da grade, o último valor com instante menor ou igual
+    # (junção "as-of" para trás). Sem valor anterior, ou com um valor mais
+    # antigo que 'tolerancia' segundos, o resultado é NaN. 'times' deve estar
+    # em ordem crescente.
+    grid = np.asarray(grid, dtype="datetime64[ns]")
+    times = np.asarray(times, dtype="datetime64[ns]")
+    values = np.asarray(values, dtype=float)
+
+    positions = np.searchsorted(times, grid, side="right") - 1
+    valid = positions >= 0
+    if tolerancia is not None:
+        age = grid - times[np.maximum(positions, 0)]
+        valid &= age <= np.timedelta64(int(round(tolerancia * 1e9)), "ns")
+
+    result = np.full(len(grid), np.nan)
+    result[valid] = values[positions[valid]]
+    return result
+
+
+def resample_series(times, values, grid, agregacao=AGREGACAO_PADRAO):
+    # Reamostra uma série irregular na grade regular. Cada ponto da grade
+    # representa o intervalo [g, g + passo):
+    #   media      - média das leituras do intervalo (NaN se vazio)
+    #   soma       - soma das leituras do intervalo (0 se vazio)
+    #   ultimo     - última leitura até o fim do intervalo
+    #   interpolar - interpolação linear no instante g
+    if agregacao not in AGREGACOES:
+        raise ValueError(f"Agregação desconhecida: {agregacao}")
+
+    grid = np.asarray(grid, dtype="datetime64[ns]")
+    times = np.asarray(times, dtype="datetime64[ns]")
+    values = np.asarray(values, dtype=float)
+
+    valid = ~np.isnan(values) & ~np.isnat(times)
+    times, values = times[valid], values[valid]
+    order = np.argsort(times, kind="stable")
+    times, values = times[order], values[order]
+
+    result = np.full(len(grid), np.nan)
+    if len(times) == 0 or len(grid) == 0:
+        return result
+
+    step = grid[1] - grid[0] if len(grid) > 1 else np.timedelta64(1, "m")
+
+    if agregacao == "interpolar":
+        seconds = (times - grid[0]) / np.timedelta64(1, "s")
+        grid_seconds = (grid - grid[0]) / np.timedelta64(1, "s")
+        return np.interp(grid_seconds, seconds, values, left=np.nan, right=np.nan)
+
+    if agregacao == "ultimo":
+        # Último valor com instante estritamente anterior ao fim do intervalo
+        ends = grid + step - np.timedelta64(1, "ns")
+        return asof_join(ends, times, values)
+
+    bins = (times - grid[0]) // step
+    inside = (bins >= 0) & (bins < len(grid))
+    bins, values = bins[inside], values[inside]
+    sums = np.bincount(bins, weights=values, minlength=len(grid))
+    if agregacao == "soma":
+        return sums
+    counts = np.bincount(bins, minlength=len(grid))
+    np.divide(sums, counts, out=result, where=counts > 0)
+    return result
+
+
+def series_files(simulacao, telhado=None):
+    # Séries dos telhados da simulação como {(telhado, tópico): arquivo}. Se um
+    # tópico existir em CSV e em .serie, a série binária é preferida.
+    telhados = [f"telhado{telhado}"] if telhado else ["telhado*"]
+    files = {}
+    for tel in telhados:
+        pattern = f"simulacao{simulacao}/{tel}/csv/*"
+        for path in sorted(glob.glob(pattern + ".csv")) + sorted(
+            glob.glob(pattern + SERIES_EXTENSION)
+        ):
+            roof = os.path.basename(os.path.dirname(os.path.dirname(path)))
+            topic = os.path.splitext(os.path.basename(path))[0]
+            files[(roof[len("telhado") :], topic)] = path
+    return files
+
+
+def aligned_frame(series, passo=PASSO_PADRAO, agregacoes=None):
+    # Monta um DataFrame largo a partir de {coluna: DataFrame com 'data' e
+    # 'body'}, com todas as séries na mesma grade regular
+    loaded = {}
+    for column, df in series.items():
+        times = df["data"].to_numpy(dtype="datetime64[ns]")
+        values = pd.to_numeric(df["body"], errors="coerce").to_numpy(dtype=float)
+        if len(times):
+            loaded[column] = (times, values)
+
+    if not loaded:
+        return pd.DataFrame({"data": pd.Series(dtype="datetime64[ns]")})
+
+    start = min(np.nanmin(times) for times, _ in loaded.values())
+    end = max(np.nanmax(times) for times, _ in loaded.values())
+    grid = regular_grid(start, end, passo)
+
+    columns = {"data": grid}
+    for column, (times, values) in loaded.items():
+        topic = column.split("/")[-1]
+        columns[column] = resample_series(
+            times, values, grid, topic_aggregation(topic, agregacoes)
+        )
+    return pd.DataFrame(columns)
+
+
+def align_simulation(simulacao, telhado=None, passo=PASSO_PADRAO, agregacoes=None):
+    # Quadro alinhado da simulação, com uma coluna "telhadoN/tópico" por série
+    series = {
+        f"telhado{roof}/{topic}": load_series(path)
+        for (roof, topic), path in series_files(simulacao, telhado).items()
+    }
+    return aligned_frame(series, passo, agregacoes)
+
+
+def aligned_path(simulacao):
+    return f"simulacao{simulacao}/alinhado.csv"
+
+
+def load_aligned(simulacao, path=None):
+    # Lê o quadro alinhado salvo por este script
+    df = pd.read_csv(path or aligned_path(simulacao))
+    df["data"] = pd.to_datetime(df["data"], format="ISO8601")
+    return df
+
+
+def parse_aggregations(pares):
+    # Converte ["Tópico=modo", ...] em um dicionário
+    agregacoes = {}
+    for par in pares or []:
+        topic, _, agregacao = par.rpartition("=")
+        if not topic or agregacao not in AGREGACOES:
+            raise ValueError(f"Agregação inválida: {par}")
+        agregacoes[topic] = agregacao
+    return agregacoes
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Alinha todas as séries de uma simulação em uma grade regular"
+    )
+    parser.add_argument(
+        "--simulacao", "-s", type=str, required=True, help="Número da simulação"
+    )
+    parser.add_argument(
+        "--telhado",
+        "-t",
+        type=str,
+        help="Número do telhado (padrão: todos os telhados da simulação)",
+    )
+    parser.add_argument(
+        "--passo",
+        type=float,
+        default=PASSO_PADRAO,
+        help="Espaçamento da grade em segundos",
+    )
+    parser.add_argument(
+        "--agregacao",
+        "-a",
+        action="append",
+        metavar="TOPICO=MODO",
+        help=f"Agregação de um tópico ({', '.join(AGREGACOES)}); pode ser repetido",
+    )
+    parser.add_argument("--saida", "-o", type=str, help="Arquivo CSV de saída")
+
+    args = parser.parse_args()
+
+    df = align_simulation(
+        args.simulacao, args.telhado, args.passo, parse_aggregations(args.agregacao)
+    )
+    output_file = args.saida or aligned_path(args.simulacao)
+    df.to_csv(output_file, index=False, date_format="%Y-%m-%dT%H:%M:%S.%f")
+    print(
+        f"Quadro alinhado ({len(df)} linhas, {len(df.columns) - 1} séries): {output_file}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+# Tratamento de Dados - Um exemplo de projeto Python
+# Copyright (C) 2024 Vinicius Patriarca Miranda Miguel
+
+# Este programa é software livre: você pode redistribuí-lo e/ou modificá-lo
+# sob os termos da Licença Pública Geral GNU como publicada pela Free Software
+# Foundation, tanto a versão 3 da Licença, como (a seu critério) qualquer versão posterior.
+
+# Este programa é distribuído na esperança de que seja útil,
+# mas SEM NENHUMA GARANTIA; sem mesmo a garantia implícita de
+# COMERCIABILIDADE ou ADEQUAÇÃO A UM DETERMINADO FIM. Veja a
+# Licença Pública Geral GNU para mais detalhes.
+
+# Você deve ter recebido uma cópia da Licença Pública Geral GNU
+# junto com este programa. Se não, veja <https://www.gnu.org/licenses/>.
+
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy.fft import irfft, next_fast_len, rfft
+
+from alinhamento import PASSO_PADRAO, align_simulation
+from eventosChuva import (
+    LIMIAR_PADRAO,
+    MINIMO_PADRAO,
+    SECA_PADRAO,
+    event_windows,
+    rain_series,
+    roof_volumes,
+    simulations,
+)
+
+# Maior atraso procurado, em minutos
+ATRASO_MAX_PADRAO = 120.0
+
+# Séries de escoamento usadas, em ordem de preferência; sem nenhuma delas o
+# escoamento é a variação do volume do telhado
+PREFIXOS_ESCOAMENTO = ("EscoamentoSuavizadoPy_", "EscoamentoPy_")
+
+COLUNAS = ["simulacao", "evento", "telhado", "atraso(min)", "correlacao"]
+
+
+def cross_correlation(x, y, max_lag):
+    # Correlação cruzada normalizada entre x (n,) e cada coluna de y (n, m)
+    # para atrasos 0..max_lag, calculada com FFT em O(n log n). O valor na
+    # linha k mede a semelhança entre x[t] e y[t + k].
+    x = np.nan_to_num(np.asarray(x, dtype=float))
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+    x = x - x.mean()
+    y = y - y.mean(axis=0)
+
+    n = len(x)
+    nfft = next_fast_len(2 * n - 1, real=True)
+    espectro = np.conj(rfft(x, nfft))[:, None] * rfft(y, nfft, axis=0)
+    correlacao = irfft(espectro, nfft, axis=0)[: min(max_lag, n - 1) + 1]
+
+    norma = np.sqrt((x**2).sum() * (y**2).sum(axis=0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return correlacao / norma
+
+
+def best_lag(x, y, max_lag):
+    # Atraso (em pontos da grade) de maior correlação e a correlação nesse
+    # atraso, para cada coluna de y
+    # (séries constantes não têm correlação definida e resultam em NaN)
+    correlacao = np.nan_to_num(cross_correlation(x, y, max_lag), nan=-np.inf)
+    atraso = np.argmax(correlacao, axis=0)
+    pico = correlacao[atraso, np.arange(correlacao.shape[1])]
+    return atraso, np.where(np.isfinite(pico), pico, np.nan)
+
+
+def roof_flows(simulacao, df, passo):
+    # Escoamento de cada telhado na grade do quadro alinhado
+    vazoes = {}
+    for prefixo in PREFIXOS_ESCOAMENTO:
+        for column in sorted(df.columns):
+            roof, _, topic = column.partition("/")
+            telhado = roof[len("telhado") :]
+            if topic.startswith(prefixo) and telhado not in vazoes:
+                vazoes[telhado] = df[column]
+
+    for telhado, volume in roof_volumes(simulacao, df).items():
+        if telhado not in vazoes:
+            vazoes[telhado] = volume.ffill().diff() * 60 / passo
+    return dict(sorted(vazoes.items()))
+
+
+def simulation_lags(
+    simulacao,
+    passo=PASSO_PADRAO,
+    atraso_max=ATRASO_MAX_PADRAO,
+    seca=SECA_PADRAO,
+    minimo=MINIMO_PADRAO,
+    limiar=LIMIAR_PADRAO,
+):
+    # Atraso chuva -> escoamento de todos os telhados de uma simulação, na
+    # série inteira (evento "todos") e em cada evento de chuva
+    df = align_simulation(simulacao, passo=passo)
+    chuva = rain_series(df)
+    vazoes = roof_flows(simulacao, df, passo)
+    if chuva is None or not vazoes:
+        print(f"Simulação {simulacao}: sem dados de chuva ou de escoamento.")
+        return pd.DataFrame(columns=COLUNAS)
+
+    telhados = list(vazoes)
+    vazao = pd.DataFrame(vazoes).to_numpy(dtype=float)
+    max_lag = int(round(atraso_max * 60 / passo))
+
+    inicios, _, fins = event_windows(chuva, passo, seca, minimo, limiar)
+    janelas = [("todos", 0, len(chuva) - 1)] + [
+        (evento, inicio, fim)
+        for evento, (inicio, fim) in enumerate(zip(inicios, fins), start=1)
+    ]
+
+    linhas = []
+    for evento, inicio, fim in janelas:
+        atraso, pico = best_lag(
+            chuva[inicio : fim + 1], vazao[inicio : fim + 1], max_lag
+        )
+        for telhado, k, r in zip(telhados, atraso, pico):
+            linhas.append((simulacao, evento, telhado, k * passo / 60, r))
+    return pd.DataFrame(linhas, columns=COLUNAS)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Estima o atraso entre a chuva e o escoamento de cada telhado"
+    )
+    parser.add_argument(
+        "--simulacao",
+        "-s",
+        type=str,
+        nargs="*",
+        help="Números das simulações (padrão: todas as do diretório atual)",
+    )
+    parser.add_argument(
+        "--passo",
+        type=float,
+        default=PASSO_PADRAO,
+        help="Espaçamento da grade em segundos",
+    )
+    parser.add_argument(
+        "--atraso-max",
+        type=float,
+        default=ATRASO_MAX_PADRAO,
+        help="Maior atraso procurado em minutos",
+    )
+    parser.add_argument(
+        "--seca",
+        type=float,
+        default=SECA_PADRAO,
+        help="Tempo seco mínimo entre eventos em minutos",
+    )
+    parser.add_argument(
+        "--minimo",
+        type=float,
+        default=MINIMO_PADRAO,
+        help="Altura mínima de chuva de um evento em mm",
+    )
+    parser.add_argument(
+        "--limiar",
+        type=float,
+        default=LIMIAR_PADRAO,
+        help="Chuva mínima (mm) em um intervalo da grade para considerá-lo chuvoso",
+    )
+    parser.add_argument(
+        "--saida",
+        "-o",
+        type=str,
+        default="atrasoEscoamento.csv",
+        help="Arquivo CSV de saída",
+    )
+
+    args = parser.parse_args()
+
+    tabelas = [
+        simulation_lags(
+            simulacao, args.passo, args.atraso_max, args.seca, args.minimo, args.limiar
+        )
+        for simulacao in (args.simulacao or simulations())
+    ]
+    tabelas = [tabela for tabela in tabelas if len(tabela)]
+    tabela = (
+        pd.concat(tabelas, ignore_index=True)
+        if tabelas
+        else pd.DataFrame(columns=COLUNAS)
+    )
+    if tabela.empty:
+        print("Nenhuma simulação com chuva e escoamento para correlacionar.")
+    tabela.to_csv(args.saida, index=False)
+    print(f"{len(tabela)} linhas (evento x telhado) salvas em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
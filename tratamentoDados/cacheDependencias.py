@@ -0,0 +1,184 @@
+# Tratamento de Dados - Um exemplo de projeto Python
+# Copyright (C) 2024 Vinicius Patriarca Miranda Miguel
+
+# Este programa é software livre: você pode redistribuí-lo e/ou modificá-lo
+# sob os termos da Licença Pública Geral GNU como publicada pela Free Software
+# Foundation, tanto a versão 3 da Licença, como (a seu critério) qualquer versão posterior.
+
+# Este programa é distribuído na esperança de que seja útil,
+# mas SEM NENHUMA GARANTIA; sem mesmo a garantia implícita de
+# COMERCIABILIDADE ou ADEQUAÇÃO A UM DETERMINADO FIM. Veja a
+# Licença Pública Geral GNU para mais detalhes.
+
+# Você deve ter recebido uma cópia da Licença Pública Geral GNU
+# junto com este programa. Se não, veja <https://www.gnu.org/licenses/>.
+
+
+import hashlib
+import json
+import os
+
+CACHE_VERSION = 1
+
+# Registro gravado em cada diretório de saída. A extensão não é .json para
+# que o registro não seja confundido com um tópico pelo criacsv.
+CACHE_FILE = ".dependencias.cache"
+
+# Tamanho (em bytes) de cada bloco lido ao calcular o hash de um arquivo
+_HASH_BLOCK = 1024 * 1024
+
+# Versão do código já calculada para cada conjunto de módulos
+_CODE_VERSIONS = {}
+
+
+def file_hash(path):
+    # Hash SHA-256 do conteúdo do arquivo, lido em blocos
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def code_version(*modules):
+    # Hash do código-fonte dos módulos que produzem uma saída: qualquer mudança
+    # nesses arquivos invalida as saídas geradas pela versão anterior
+    files = tuple(sorted(os.path.abspath(module.__file__) for module in modules))
+    if files not in _CODE_VERSIONS:
+        digest = hashlib.sha256()
+        for path in files:
+            digest.update(os.path.basename(path).encode())
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        _CODE_VERSIONS[files] = digest.hexdigest()
+    return _CODE_VERSIONS[files]
+
+
+def add_force_argument(parser, ajuda):
+    # Opção --forcar comum aos scripts que registram as suas saídas; 'ajuda'
+    # descreve o que o script refaz
+    parser.add_argument("--forcar", "--force", action="store_true", help=ajuda)
+
+
+def config_hash(parametros, codigo):
+    # Hash dos parâmetros (qualquer valor serializável em JSON) e da versão do
+    # código de uma etapa
+    texto = json.dumps([parametros, codigo], sort_keys=True, default=str)
+    return hashlib.sha256(texto.encode()).hexdigest()
+
+
+class DependencyCache:
+    """Registro de dependências das saídas de um diretório.
+
+    Para cada saída (identificada por uma chave, normalmente o nome do arquivo)
+    guarda o hash das entradas, dos parâmetros e do código que a produziram e
+    o hash das próprias saídas. Como no make, uma saída que existe está
+    atualizada se nada disso mudou; ao contrário do make, a comparação é pelo
+    conteúdo e não pela data de modificação. Os hashes dos arquivos são reaproveitados
+    enquanto o tamanho e a data de modificação não mudam.
+    """
+
+    def __init__(self, output_dir, forcar=False):
+        self.path = os.path.join(output_dir, CACHE_FILE)
+        self.forcar = forcar
+        self.arquivos = {}
+        self.saidas = {}
+        try:
+            with open(self.path, "r") as f:
+                registro = json.load(f)
+            if registro.get("versao") == CACHE_VERSION:
+                self.arquivos = registro["arquivos"]
+                self.saidas = registro["saidas"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    @classmethod
+    def from_args(cls, output_dir, args):
+        # Registro do diretório de saída, ignorado com a opção --forcar
+        return cls(output_dir, args.forcar)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.save()
+
+    def hash(self, path):
+        # Hash do arquivo, recalculado só quando o tamanho ou a data mudam
+        path = os.path.normpath(path)
+        stat = os.stat(path)
+        cached = self.arquivos.get(path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        digest = file_hash(path)
+        self.arquivos[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def input_hashes(self, entradas):
+        # Hashes das entradas como {caminho: hash}. 'entradas' é uma lista de
+        # caminhos ou um dicionário já calculado (por exemplo, o hash de só um
+        # trecho de um arquivo, ou hashes tirados antes de a etapa
+        # sobrescrever a própria entrada), devolvido sem mudanças.
+        if isinstance(entradas, dict):
+            return {os.path.normpath(path): digest for path, digest in entradas.items()}
+        return {os.path.normpath(path): self.hash(path) for path in entradas}
+
+    def is_up_to_date(self, chave, entradas, parametros, codigo):
+        # A saída está atualizada se foi gerada com os mesmos parâmetros e
+        # código, se as saídas gravadas ainda existem e se cada entrada tem o
+        # conteúdo registrado. Uma entrada que também é saída (correção no
+        # próprio arquivo) é comparada com o conteúdo deixado pela etapa.
+        registro = self.saidas.get(chave)
+        if self.forcar or registro is None:
+            return False
+        if registro["config"] != config_hash(parametros, codigo):
+            return False
+        if not all(os.path.exists(path) for path in registro["saidas"]):
+            return False
+
+        try:
+            entradas = self.input_hashes(entradas)
+        except OSError:
+            return False
+        for path, digest in entradas.items():
+            esperado = registro["saidas"].get(path, registro["entradas"].get(path))
+            if digest != esperado:
+                return False
+        return True
+
+    def record(self, chave, entradas, parametros, codigo, saidas):
+        # Registra como as saídas foram geradas
+        self.saidas[chave] = {
+            "config": config_hash(parametros, codigo),
+            "entradas": self.input_hashes(entradas),
+            "saidas": {os.path.normpath(path): self.hash(path) for path in saidas},
+        }
+
+    def forget(self, chave):
+        self.saidas.pop(chave, None)
+
+    def save(self):
+        # Mantém só os hashes de arquivos citados por algum registro e escreve
+        # em um arquivo temporário para não deixar um registro incompleto
+        citados = set()
+        for registro in self.saidas.values():
+            citados.update(registro["entradas"])
+            citados.update(registro["saidas"])
+        self.arquivos = {
+            path: cached for path, cached in self.arquivos.items() if path in citados
+        }
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "versao": CACHE_VERSION,
+                    "arquivos": self.arquivos,
+                    "saidas": self.saidas,
+                },
+                f,
+                separators=(",", ":"),
+                sort_keys=True,
+            )
+        os.replace(tmp_path, self.path)
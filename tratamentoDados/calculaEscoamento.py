@@ -15,39 +15,109 @@
 
 import argparse
 import glob
+import json
 import os
+import sys
 
+import numpy as np
 import pandas as pd
 
+import leituraSerie
+from cacheDependencias import DependencyCache, add_force_argument, code_version
+from leituraSerie import RAIO_GALAO, find_series, parse_time
+
+# Raio padrão do galão em cm (o mesmo valor fixo do firmware do ESP)
+RAIO_PADRAO = 30
+
+# Fatores de conversão a partir de cm³ e de minutos
+UNIDADES_VOLUME = {"cm3": 1.0, "L": 1e-3, "m3": 1e-6}
+UNIDADES_TEMPO = {"s": 1 / 60, "min": 1.0, "h": 60.0}
+
+
+def load_geometry(simulacao, telhado, raio=None, raio_galao=None):
+    # Geometria do tanque de um telhado. O raio vem, em ordem de prioridade,
+    # do argumento, do arquivo simulacao{N}/telhado{T}/tanque.json, do tópico
+    # terminado em RaioGalao publicado pelo ESP ou do valor padrão. O tanque.json também
+    # pode definir as unidades, por exemplo
+    #   {"raio": 25, "unidade_volume": "L", "unidade_tempo": "s"}
+    # Com raio_galao (DataFrame do tópico já carregado), o CSV não é lido.
+    geometry = {"raio": RAIO_PADRAO, "unidade_volume": "cm3", "unidade_tempo": "min"}
+
+    raio_csv = find_series(f"simulacao{simulacao}/telhado{telhado}/csv", RAIO_GALAO)
+    if raio_galao is None and raio_csv is not None:
+        raio_galao = pd.read_csv(raio_csv)
+    if raio_galao is not None:
+        valores = pd.to_numeric(raio_galao["body"], errors="coerce")
+        valores = valores.dropna()
+        if len(valores):
+            geometry["raio"] = float(valores.iloc[-1])
+
+    tanque_json = f"simulacao{simulacao}/telhado{telhado}/tanque.json"
+    if os.path.isfile(tanque_json):
+        with open(tanque_json, "r") as f:
+            geometry.update(json.load(f))
+
+    if raio is not None:
+        geometry["raio"] = raio
+    return geometry
+
+
+def compute_flow(
+    tempos, niveis, raio=RAIO_PADRAO, unidade_volume="cm3", unidade_tempo="min"
+):
+    # Escoamento entre amostras consecutivas: variação de nível vezes a área
+    # da seção do cilindro, dividida pelo intervalo de tempo. Retorna o
+    # escoamento de cada amostra a partir da segunda e a máscara dos intervalos
+    # válidos (intervalos nulos ou negativos são descartados).
+    area_seccao = np.pi * raio**2  # π * r^2, em cm²
+    fator = UNIDADES_VOLUME[unidade_volume] * UNIDADES_TEMPO[unidade_tempo]
+
+    diferenca_nivel = np.diff(np.asarray(niveis, dtype=float))
+    diferenca_tempo = np.diff(tempos.to_numpy(dtype="datetime64[ns]"))
+    diferenca_tempo = diferenca_tempo / np.timedelta64(1, "m")  # em minutos
+
+    validos = diferenca_tempo > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        escoamento = diferenca_nivel * area_seccao * fator / diferenca_tempo
+    return escoamento, validos
+
+
+def is_level_input(file_name):
+    # Séries de nível usadas no cálculo (as saídas de execuções anteriores
+    # também contêm "NivelAgua" no nome e são ignoradas)
+    return "NivelAgua" in file_name and not file_name.startswith("Escoamento")
+
+
+def flow_frame(df, raio=RAIO_PADRAO, unidade_volume="cm3", unidade_tempo="min"):
+    # Calcula em memória o DataFrame de escoamento de uma série de nível.
+    # Retorna também o número de intervalos descartados.
+
+    # Converter a coluna de tempo uma única vez, de forma vetorizada
+    tempos = parse_time(df["data"])
+    niveis = pd.to_numeric(df["body"], errors="coerce")
+
+    escoamento, validos = compute_flow(
+        tempos, niveis, raio, unidade_volume, unidade_tempo
+    )
 
-def process_csv(input_file, output_file):
-    df = pd.read_csv(input_file)
-    escoamento_rows = []
-
-    # Definir o raio do cilindro em cm
-    raio = 30
-    area_seccao = 3.14 * (raio**2)  # π * r^2
-
-    # Iterar sobre as linhas do dataframe para calcular o escoamento
-    for i in range(1, len(df)):
-        nivel_anterior = df.iloc[i]["body"]
-        nivel_atual = df.iloc[i - 1]["body"]
-        diferenca_nivel = nivel_atual - nivel_anterior
-
-        # Diferença de tempo em segundos
-        tempo_anterior = pd.to_datetime(df.iloc[i]["data"])
-        tempo_atual = pd.to_datetime(df.iloc[i - 1]["data"])
-        diferenca_tempo = ((tempo_atual - tempo_anterior).total_seconds()) / 60
+    # Criar um novo dataframe com os resultados do escoamento, associados ao
+    # instante da segunda amostra de cada par
+    escoamento_df = pd.DataFrame(
+        {"data": df["data"].to_numpy()[1:][validos], "body": escoamento[validos]}
+    )
 
-        escoamento = (diferenca_nivel * area_seccao) / diferenca_tempo
+    return escoamento_df, len(validos) - int(validos.sum())
 
-        escoamento_rows.append({"data": df.iloc[i]["data"], "body": escoamento})
 
-    # Criar um novo dataframe com os resultados do escoamento
-    escoamento_df = pd.DataFrame(escoamento_rows)
+def process_csv(
+    input_file, output_file, raio=RAIO_PADRAO, unidade_volume="cm3", unidade_tempo="min"
+):
+    df = pd.read_csv(input_file)
+    escoamento_df, descartados = flow_frame(df, raio, unidade_volume, unidade_tempo)
 
     # Salvar o novo dataframe no arquivo de saída
     escoamento_df.to_csv(output_file, index=False)
+    return descartados
 
 
 def main():
@@ -60,23 +130,74 @@ def main():
     parser.add_argument(
         "--telhado", "-t", type=str, required=True, help="Número do telhado"
     )
+    parser.add_argument(
+        "--raio",
+        type=float,
+        help="Raio do galão em cm (padrão: tanque.json, tópico RaioGalao ou 30)",
+    )
+    parser.add_argument(
+        "--unidade-volume", choices=list(UNIDADES_VOLUME), help="Unidade de volume"
+    )
+    parser.add_argument(
+        "--unidade-tempo", choices=list(UNIDADES_TEMPO), help="Unidade de tempo"
+    )
+    add_force_argument(
+        parser, "Recalcula o escoamento mesmo que as saídas já estejam atualizadas"
+    )
 
     args = parser.parse_args()
 
+    geometry = load_geometry(args.simulacao, args.telhado, args.raio)
+    unidade_volume = args.unidade_volume or geometry["unidade_volume"]
+    unidade_tempo = args.unidade_tempo or geometry["unidade_tempo"]
+
     input_pattern = (
         f"simulacao{args.simulacao}/telhado{args.telhado}/csv/*NivelAgua*.csv"
     )
     output_dir = f"simulacao{args.simulacao}/telhado{args.telhado}/csv/"
 
-    # Encontrar todos os arquivos que correspondem ao padrão
-    input_files = glob.glob(input_pattern)
+    # Encontrar todos os arquivos que correspondem ao padrão, exceto as saídas
+    # de execuções anteriores
+    input_files = [
+        input_file
+        for input_file in glob.glob(input_pattern)
+        if is_level_input(os.path.basename(input_file))
+    ]
+
+    # A geometria entra nos parâmetros já resolvida, de modo que uma mudança
+    # no tanque.json ou no tópico RaioGalao também refaz o cálculo
+    cache = DependencyCache.from_args(output_dir, args)
+    parametros = {
+        "raio": geometry["raio"],
+        "unidade_volume": unidade_volume,
+        "unidade_tempo": unidade_tempo,
+    }
+    codigo = code_version(sys.modules[__name__], leituraSerie)
 
     # Processar cada arquivo encontrado
     for input_file in input_files:
         output_file = os.path.join(
             output_dir, f"EscoamentoPy_{os.path.basename(input_file)}"
         )
-        process_csv(input_file, output_file)
+        chave = os.path.basename(output_file)
+        if cache.is_up_to_date(chave, [input_file], parametros, codigo):
+            print(f"Saída atualizada: {output_file}")
+            continue
+
+        descartados = process_csv(
+            input_file,
+            output_file,
+            geometry["raio"],
+            unidade_volume,
+            unidade_tempo,
+        )
+        cache.record(chave, [input_file], parametros, codigo, [output_file])
+        if descartados:
+            print(
+                f"{input_file}: {descartados} intervalos de tempo nulos ou negativos descartados"
+            )
+
+    cache.save()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,81 @@
+# Tratamento de Dados - Um exemplo de projeto Python
+# Copyright (C) 2024 Vinicius Patriarca Miranda Miguel
+
+# Este programa é software livre: você pode redistribuí-lo e/ou modificá-lo
+# sob os termos da Licença Pública Geral GNU como publicada pela Free Software
+# Foundation, tanto a versão 3 da Licença, como (a seu critério) qualquer versão posterior.
+
+# Este programa é distribuído na esperança de que seja útil,
+# mas SEM NENHUMA GARANTIA; sem mesmo a garantia implícita de
+# COMERCIABILIDADE ou ADEQUAÇÃO A UM DETERMINADO FIM. Veja a
+# Licença Pública Geral GNU para mais detalhes.
+
+# Você deve ter recebido uma cópia da Licença Pública Geral GNU
+# junto com este programa. Se não, veja <https://www.gnu.org/licenses/>.
+
+import bz2
+import gzip
+import lzma
+import os
+
+# Módulos de compressão suportados, por extensão
+COMPRESSORS = {".gz": gzip, ".xz": lzma, ".bz2": bz2}
+
+# Assinaturas (magic bytes) de cada formato, para arquivos sem extensão
+_MAGIC = [(b"\x1f\x8b", gzip), (b"\xfd7zXZ\x00", lzma), (b"BZh", bz2)]
+
+
+def compression_module(path):
+    # Retorna o módulo de compressão do arquivo (pela extensão ou, se ela não
+    # indicar, pelos primeiros bytes), ou None para arquivos sem compressão
+    extension = os.path.splitext(path)[1]
+    if extension in COMPRESSORS:
+        return COMPRESSORS[extension]
+
+    try:
+        with open(path, "rb") as f:
+            head = f.read(6)
+    except OSError:
+        return None
+    for magic, module in _MAGIC:
+        if head.startswith(magic):
+            return module
+    return None
+
+
+def is_compressed(path):
+    return compression_module(path) is not None
+
+
+def strip_compression(filename):
+    # Remove a extensão de compressão do nome, se houver ("a.json.gz" -> "a.json")
+    base, extension = os.path.splitext(filename)
+    return base if extension in COMPRESSORS else filename
+
+
+def find_input(path):
+    # Procura o arquivo de entrada ou uma versão comprimida dele ao lado
+    if os.path.exists(path):
+        return path
+    for extension in COMPRESSORS:
+        if os.path.exists(path + extension):
+            return path + extension
+    return path
+
+
+def open_input(path, mode="rt"):
+    # Abre o arquivo para leitura, descomprimindo em fluxo quando necessário
+    module = compression_module(path)
+    if module is None:
+        return open(path, mode)
+    return module.open(path, mode)
+
+
+def open_output(path, mode="wt", buffering=-1):
+    # Abre o arquivo para escrita, comprimindo conforme a extensão do caminho.
+    # Acrescentar ("at") a um arquivo comprimido cria um novo membro/fluxo,
+    # que gzip, xz e bz2 leem como continuação do anterior.
+    extension = os.path.splitext(path)[1]
+    if extension in COMPRESSORS:
+        return COMPRESSORS[extension].open(path, mode)
+    return open(path, mode, buffering=buffering)
@@ -14,11 +14,50 @@
 # junto com este programa. Se não, veja <https://www.gnu.org/licenses/>.
 
 import argparse
+import os
+import sys
 
 import pandas as pd
 
-
-def process_csv(input_file, output_file):
+import filtroMonotono
+import leituraSerie
+from cacheDependencias import DependencyCache, add_force_argument, code_version
+from filtroMonotono import (
+    PESOS,
+    correction_weights,
+    isotonic_correction,
+    monotone_filter,
+)
+from leituraSerie import parse_time
+
+
+def sort_by_time(df):
+    # Converte a coluna 'data' para datetime (H:MM ou data e hora completas) e
+    # ordena o DataFrame por ela
+    return df.assign(data=parse_time(df["data"])).sort_values(by="data")
+
+
+def correct_level(df, tolerancia=0.0, histerese=0.0, modo="filtro", pesos="uniforme"):
+    # Corrige em memória a série de nível já ordenada por sort_by_time,
+    # mantendo (ou ajustando, no modo isotonic) apenas a parte não decrescente
+
+    if modo == "isotonic":
+        # Ajustar uma série não decrescente mantendo todos os instantes
+        weights = correction_weights(df["data"], pesos)
+        return isotonic_correction(df, "body", "forward", weights)
+
+    # Manter apenas as linhas cujo body não é menor que o maior body anterior
+    return monotone_filter(df, "body", "forward", tolerancia, histerese)
+
+
+def process_csv(
+    input_file,
+    output_file,
+    tolerancia=0.0,
+    histerese=0.0,
+    modo="filtro",
+    pesos="uniforme",
+):
     # Configurar pandas para exibir todas as colunas e linhas
     # pd.set_option('display.max_rows', None)  # Mostra todas as linhas
     # pd.set_option('display.max_columns', None)  # Mostra todas as colunas
@@ -27,27 +66,11 @@ def process_csv(input_file, output_file):
     # Ler o arquivo CSV
     df = pd.read_csv(input_file)
 
-    # Converter a coluna 'data' para datetime, especificando o formato
-    df["data"] = pd.to_datetime(df["data"], format="%H:%M")
-
-    # Ordenar o DataFrame pela coluna 'data'
-    df = df.sort_values(by="data")
+    # Converter a coluna 'data' para datetime e ordenar o DataFrame por ela
+    df = sort_by_time(df)
     print(df)  # Imprime o DataFrame completo
 
-    # Inicializar uma lista para armazenar as linhas que atendem à condição
-    filtered_rows = []
-
-    # Definir o valor mínimo inicial como o primeiro valor da coluna 'body' após a ordenação
-    minimo = df.iloc[0]["body"]
-
-    # Iterar sobre as linhas do dataframe
-    for i in range(len(df)):
-        if df.iloc[i]["body"] >= minimo:
-            filtered_rows.append(df.iloc[i])
-            minimo = df.iloc[i]["body"]  # Atualiza o valor mínimo
-
-    # Criar um novo DataFrame com as linhas filtradas
-    filtered_df = pd.DataFrame(filtered_rows)
+    filtered_df = correct_level(df, tolerancia, histerese, modo, pesos)
 
     # Salvar o novo DataFrame no arquivo de saída
     filtered_df.to_csv(output_file, index=False)
@@ -63,6 +86,31 @@ def main():
     parser.add_argument(
         "--telhado", "-t", type=str, required=True, help="Número do telhado"
     )
+    parser.add_argument(
+        "--tolerancia",
+        type=float,
+        default=0.0,
+        help="Mantém pontos até este valor abaixo da referência",
+    )
+    parser.add_argument(
+        "--histerese",
+        type=float,
+        default=0.0,
+        help="A referência só muda quando um ponto a supera em pelo menos este valor",
+    )
+    parser.add_argument(
+        "--modo",
+        choices=["filtro", "isotonic"],
+        default="filtro",
+        help="filtro: remove os pontos fora da série monótona; isotonic: ajusta uma regressão isotônica mantendo todos os pontos",
+    )
+    parser.add_argument(
+        "--pesos",
+        choices=PESOS,
+        default="uniforme",
+        help="Pesos da regressão isotônica: iguais ou proporcionais ao intervalo de tempo de cada amostra",
+    )
+    add_force_argument(parser, "Corrige a série mesmo que a saída já esteja atualizada")
 
     args = parser.parse_args()
 
@@ -71,7 +119,30 @@ def main():
     )
     output_file = f"simulacao{args.simulacao}/telhado{args.telhado}/csv/NivelAguaCorrigido(cm).csv"
 
-    process_csv(input_file, output_file)
+    # Pula a correção se a entrada, as opções e o código não mudaram
+    cache = DependencyCache.from_args(os.path.dirname(output_file), args)
+    parametros = {
+        "tolerancia": args.tolerancia,
+        "histerese": args.histerese,
+        "modo": args.modo,
+        "pesos": args.pesos,
+    }
+    codigo = code_version(sys.modules[__name__], filtroMonotono, leituraSerie)
+    chave = os.path.basename(output_file)
+    if cache.is_up_to_date(chave, [input_file], parametros, codigo):
+        print(f"Saída atualizada: {output_file}")
+        return
+
+    process_csv(
+        input_file,
+        output_file,
+        args.tolerancia,
+        args.histerese,
+        args.modo,
+        args.pesos,
+    )
+    cache.record(chave, [input_file], parametros, codigo, [output_file])
+    cache.save()
 
 
 if __name__ == "__main__":
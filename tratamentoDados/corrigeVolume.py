@@ -14,31 +14,52 @@
 # junto com este programa. Se não, veja <https://www.gnu.org/licenses/>.
 
 import argparse
+import os
+import sys
 
 import pandas as pd
 
-
-def process_csv(input_file, output_file):
+import filtroMonotono
+import leituraSerie
+from cacheDependencias import DependencyCache, add_force_argument, code_version
+from filtroMonotono import (
+    PESOS,
+    correction_weights,
+    isotonic_correction,
+    monotone_filter,
+)
+from leituraSerie import parse_time
+
+
+def correct_volume(df, tolerancia=0.0, histerese=0.0, modo="filtro", pesos="uniforme"):
+    # Corrige a série de volume em memória
+    if modo == "isotonic":
+        # Ajustar a mesma série monótona que o filtro produz, mantendo todas
+        # as linhas
+        weights = correction_weights(parse_time(df["data"]), pesos)
+        return isotonic_correction(df, "body", "backward", weights)
+
+    # Manter as linhas cujo body não é menor que nenhum body posterior,
+    # percorrendo a série de trás para frente a partir do último valor
+    filtered_df = monotone_filter(df, "body", "backward", tolerancia, histerese)
+
+    # Como na versão anterior, a primeira linha é sempre mantida e
+    # acrescentada ao final do arquivo
+    return pd.concat([filtered_df, df.iloc[[0]]])
+
+
+def process_csv(
+    input_file,
+    output_file,
+    tolerancia=0.0,
+    histerese=0.0,
+    modo="filtro",
+    pesos="uniforme",
+):
     # Ler o arquivo CSV
     df = pd.read_csv(input_file)
 
-    # Inicializar uma lista para armazenar as linhas que atendem à condição
-    filtered_rows = [df.iloc[0]]
-
-    # Definir o valor mínimo inicial como o último valor da coluna 'body'
-    minimo = df.iloc[len(df) - 1]["body"]
-
-    # Iterar sobre as linhas do dataframe de trás para frente
-    for i in range(len(df) - 1, -1, -1):
-        if df.iloc[i]["body"] >= minimo:
-            filtered_rows.append(df.iloc[i])
-            minimo = df.iloc[i]["body"]
-
-    # Reverter a lista filtrada para manter a ordem original
-    filtered_rows.reverse()
-
-    # Criar um novo dataframe com as linhas filtradas
-    filtered_df = pd.DataFrame(filtered_rows)
+    filtered_df = correct_volume(df, tolerancia, histerese, modo, pesos)
 
     # Salvar o novo dataframe no arquivo de saída
     filtered_df.to_csv(output_file, index=False)
@@ -54,13 +75,67 @@ def main():
     parser.add_argument(
         "--telhado", "-t", type=str, required=True, help="Número do telhado"
     )
+    parser.add_argument(
+        "--tolerancia",
+        type=float,
+        default=0.0,
+        help="Mantém pontos até este valor abaixo da referência",
+    )
+    parser.add_argument(
+        "--histerese",
+        type=float,
+        default=0.0,
+        help="A referência só muda quando um ponto a supera em pelo menos este valor",
+    )
+    parser.add_argument(
+        "--modo",
+        choices=["filtro", "isotonic"],
+        default="filtro",
+        help="filtro: remove os pontos fora da série monótona; isotonic: ajusta uma regressão isotônica mantendo todos os pontos",
+    )
+    parser.add_argument(
+        "--pesos",
+        choices=PESOS,
+        default="uniforme",
+        help="Pesos da regressão isotônica: iguais ou proporcionais ao intervalo de tempo de cada amostra",
+    )
+    add_force_argument(
+        parser,
+        "Corrige a série mesmo que ela já tenha sido corrigida com as mesmas opções",
+    )
 
     args = parser.parse_args()
 
     input_file = f"simulacao{args.simulacao}/telhado{args.telhado}/csv/Volume(cm3).csv"
     output_file = f"simulacao{args.simulacao}/telhado{args.telhado}/csv/Volume(cm3).csv"
 
-    process_csv(input_file, output_file)
+    # A correção sobrescreve a própria entrada: o arquivo já corrigido com as
+    # mesmas opções e código não é corrigido de novo
+    cache = DependencyCache.from_args(os.path.dirname(output_file), args)
+    parametros = {
+        "tolerancia": args.tolerancia,
+        "histerese": args.histerese,
+        "modo": args.modo,
+        "pesos": args.pesos,
+    }
+    codigo = code_version(sys.modules[__name__], filtroMonotono, leituraSerie)
+    chave = os.path.basename(output_file)
+    if cache.is_up_to_date(chave, [input_file], parametros, codigo):
+        print(f"Saída atualizada: {output_file}")
+        return
+
+    # Hash da entrada tirado antes de ela ser sobrescrita
+    entradas = cache.input_hashes([input_file])
+    process_csv(
+        input_file,
+        output_file,
+        args.tolerancia,
+        args.histerese,
+        args.modo,
+        args.pesos,
+    )
+    cache.record(chave, entradas, parametros, codigo, [output_file])
+    cache.save()
 
 
 if __name__ == "__main__":
@@ -16,60 +16,303 @@
 import argparse
 import csv
 import json
+import multiprocessing
 import os
+import sys
+from array import array
 from datetime import datetime
 
+import pandas as pd
 
-def json_to_csv(input_file, output_file):
-    # Lê o arquivo JSON de entrada
-    with open(input_file, "r") as f:
-        data = json.load(f)
+import compressao
+import serieBinaria
+import tempo as modulo_tempo
+from cacheDependencias import DependencyCache, add_force_argument, code_version
+from compressao import COMPRESSORS, open_input, strip_compression
+from serieBinaria import SERIES_EXTENSION, write_series
+from tempo import mongo_date_to_epoch_ms
 
-    # Abre o arquivo CSV para escrita
-    with open(output_file, "w", newline="") as csvfile:
-        fieldnames = ["data", "body"]
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+# Tamanho (em caracteres) de cada trecho lido do JSON de entrada
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# Caracteres que podem seguir um elemento do array
+_SEPARATORS = frozenset(",] \t\r\n")
+
+
+def _body_value(body):
+    # Valor numérico do body, ou NaN quando não for um número
+    try:
+        return float(body)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def iter_json_array(f, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Lê um array JSON de forma incremental, devolvendo um elemento por vez.
+    # Apenas um trecho de ~chunk_size caracteres do arquivo fica em memória.
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def fill():
+        # Descarta o trecho já consumido e lê mais um bloco do arquivo
+        nonlocal buffer, pos, eof
+        chunk = f.read(chunk_size)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    def next_char():
+        # Avança até o próximo caractere que não seja espaço em branco
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer) or eof:
+                return buffer[pos] if pos < len(buffer) else ""
+            fill()
+
+    if next_char() != "[":
+        raise json.JSONDecodeError("Esperado um array JSON", buffer, pos)
+    pos += 1
+
+    first = True
+    while True:
+        char = next_char()
+        if char == "]":
+            return
+        if not first:
+            if char != ",":
+                raise json.JSONDecodeError("Esperado ',' ou ']'", buffer, pos)
+            pos += 1
+            next_char()
+        first = False
+
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+                # Um valor que não é seguido por um separador pode estar
+                # incompleto (por exemplo, um número cortado no fim do trecho);
+                # lê mais antes de aceitar
+                if eof or (end < len(buffer) and buffer[end] in _SEPARATORS):
+                    break
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            fill()
+        pos = end
+        yield item
+
+
+def format_time(datetime_str, tempo="hm"):
+    # Texto da coluna 'data' a partir do "$date" do MongoDB
+    dt = datetime.fromisoformat(
+        datetime_str[:-1]
+    )  # Remove o 'Z' do final e converte para datetime
 
-        # Escreve o cabeçalho no arquivo CSV
+    if tempo == "completo":
+        # Data e hora completas (UTC) com precisão de milissegundos
+        return dt.isoformat(timespec="milliseconds")
+    # Formato H.MM com minutos sempre em dois dígitos
+    return f"{dt.hour}:{dt.minute:02d}"
+
+
+def items_to_frame(items, tempo="hm"):
+    # Converte os itens de um tópico no mesmo DataFrame que a leitura do CSV
+    # gerado por json_to_csv produziria, sem passar pelo disco
+    df = pd.DataFrame(
+        {
+            "data": [format_time(item["datetime"]["$date"], tempo) for item in items],
+            "body": [item["body"] for item in items],
+        }
+    )
+
+    # Como no read_csv, o body só vira número se todos os valores forem números
+    body = pd.to_numeric(df["body"], errors="coerce")
+    if body.notna().sum() == df["body"].notna().sum():
+        df["body"] = body
+    return df
+
+
+def items_to_csv(items, output_file, tempo="hm"):
+    # Grava os itens de um tópico já carregados no mesmo CSV que json_to_csv
+    # produziria, mantendo o body como veio no JSON
+    with open(output_file, "w", newline="") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=["data", "body"])
         writer.writeheader()
+        writer.writerows(
+            {
+                "data": format_time(item["datetime"]["$date"], tempo),
+                "body": item["body"],
+            }
+            for item in items
+        )
+
+
+def json_to_csv(
+    input_file, output_file, series_file=None, tempo="hm", batch_size=10000
+):
+    try:
+        # Abre o arquivo CSV para escrita
+        with open_input(input_file, "rt") as f, open(
+            output_file, "w", newline=""
+        ) as csvfile:
+            fieldnames = ["data", "body"]
+            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+
+            # Escreve o cabeçalho no arquivo CSV
+            writer.writeheader()
+
+            # Colunas da série binária, preenchidas junto com o CSV
+            timestamps_ms = array("q")
+            values = array("d")
+
+            # Linhas pendentes, escritas no CSV em lotes de batch_size
+            rows = []
+
+            # Lê o JSON de entrada um elemento por vez (descomprimindo em
+            # fluxo se necessário) e escreve no CSV
+            for item in iter_json_array(f):
+                datetime_str = item["datetime"]["$date"]
+                body = item["body"]
+                data_str = format_time(datetime_str, tempo)
 
-        # Itera sobre cada objeto no JSON e escreve no CSV
-        for item in data:
-            datetime_str = item["datetime"]["$date"]
-            body = item["body"]
+                # Acumula a linha para o próximo lote do arquivo CSV
+                rows.append({"data": data_str, "body": body})
+                if len(rows) >= batch_size:
+                    writer.writerows(rows)
+                    rows = []
 
-            # Formata a data e extrai componentes
-            dt = datetime.fromisoformat(
-                datetime_str[:-1]
-            )  # Remove o 'Z' do final e converte para datetime
+                if series_file is not None:
+                    timestamps_ms.append(mongo_date_to_epoch_ms(datetime_str))
+                    values.append(_body_value(body))
 
-            hour_minute = f"{dt.hour}:{dt.minute:02d}"  # Formato H.MM com minutos sempre em dois dígitos
+            writer.writerows(rows)
+    except BaseException:
+        # Não deixa um CSV incompleto quando a conversão falha
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        raise
 
-            # Escreve a linha no arquivo CSV
-            writer.writerow({"data": hour_minute, "body": body})
+    # Escreve a série colunar (instantes int64 e valores float64)
+    if series_file is not None:
+        write_series(
+            series_file,
+            timestamps_ms,
+            values,
+            {"topico": os.path.splitext(os.path.basename(output_file))[0]},
+        )
 
 
-def process_folder(input_folder, output_folder):
+def _convert_file(job):
+    # Executado em um processo do pool: converte um arquivo e devolve o
+    # resultado em vez de interromper o lote em caso de erro
+    filename, input_file, output_file, series_file, tempo = job
+    try:
+        json_to_csv(input_file, output_file, series_file, tempo)
+        return filename, output_file, None
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError, OSError) as e:
+        return filename, output_file, e
+
+
+def select_inputs(input_folder):
+    # Arquivos JSON da pasta, um por arquivo CSV de saída. Quando o mesmo
+    # tópico existe em mais de uma versão (por exemplo X.json e X.json.xz),
+    # todas gerariam o mesmo X.csv: fica a versão comprimida e, entre elas, a
+    # mais recente. Retorna os escolhidos e os ignorados.
+    versoes = {}
+    for filename in os.listdir(input_folder):
+        if strip_compression(filename).endswith(".json"):
+            versoes.setdefault(strip_compression(filename), []).append(filename)
+
+    escolhidos, ignorados = [], []
+    for nome, filenames in sorted(versoes.items()):
+        filenames.sort(
+            key=lambda filename: (
+                os.path.splitext(filename)[1] in COMPRESSORS,
+                os.stat(os.path.join(input_folder, filename)).st_mtime_ns,
+            )
+        )
+        escolhidos.append(filenames[-1])
+        ignorados += filenames[:-1]
+        if len(filenames) > 1:
+            print(
+                f"Aviso: {nome} existe em mais de uma versão "
+                f"({', '.join(filenames)}); usando {filenames[-1]}"
+            )
+    return escolhidos, ignorados
+
+
+def process_folder(
+    input_folder, output_folder, binario=False, tempo="hm", processos=1, forcar=False
+):
     # Verifica se o diretório de saída existe, senão cria
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
-    # Itera sobre todos os arquivos na pasta de entrada
-    for filename in os.listdir(input_folder):
-        if filename.endswith(".json"):
-            input_file = os.path.join(input_folder, filename)
+    # O parâmetro 'tempo' esconde o nome do módulo, importado como modulo_tempo
+    opcoes = {"binario": binario, "tempo": tempo}
+    codigo = code_version(sys.modules[__name__], compressao, serieBinaria, modulo_tempo)
+    cache = DependencyCache(output_folder, forcar)
+    jobs = []
+    saidas = {}
+    skipped = 0
 
-            # Cria o nome do arquivo de saída CSV baseado no nome do arquivo JSON
-            output_file = os.path.join(
-                output_folder, os.path.splitext(filename)[0] + ".csv"
-            )
+    # Itera sobre os arquivos JSON da pasta de entrada, uma versão de cada
+    # tópico, para que dois processos nunca escrevam o mesmo CSV
+    escolhidos, ignorados = select_inputs(input_folder)
+    for filename in ignorados:
+        cache.forget(filename)
+    for filename in escolhidos:
+        input_file = os.path.join(input_folder, filename)
 
-            # Converte o JSON para CSV
-            try:
-                json_to_csv(input_file, output_file)
-                print(f"Arquivo CSV criado: {output_file}")
-            except json.JSONDecodeError as e:
-                print(f"Erro ao processar {input_file}: {e}")
+        # Cria o nome do arquivo de saída CSV baseado no nome do arquivo JSON
+        output_file = os.path.join(
+            output_folder,
+            os.path.splitext(strip_compression(filename))[0] + ".csv",
+        )
+
+        # Arquivo da série binária ao lado do CSV, se solicitado
+        series_file = None
+        outputs = [output_file]
+        if binario:
+            series_file = os.path.splitext(output_file)[0] + SERIES_EXTENSION
+            outputs.append(series_file)
+
+        # Pula os arquivos cujas saídas já estão atualizadas
+        if cache.is_up_to_date(filename, [input_file], opcoes, codigo):
+            skipped += 1
+            continue
+
+        saidas[filename] = (input_file, outputs)
+        jobs.append((filename, input_file, output_file, series_file, tempo))
+
+    # Converte os JSON para CSV, em paralelo se solicitado
+    if processos > 1 and len(jobs) > 1:
+        with multiprocessing.Pool(min(processos, len(jobs))) as pool:
+            results = list(pool.imap_unordered(_convert_file, jobs))
+    else:
+        results = map(_convert_file, jobs)
+
+    converted = failed = 0
+    for filename, output_file, error in results:
+        input_file, outputs = saidas[filename]
+        if error is None:
+            cache.record(filename, [input_file], opcoes, codigo, outputs)
+            converted += 1
+            print(f"Arquivo CSV criado: {output_file}")
+        else:
+            cache.forget(filename)
+            failed += 1
+            print(f"Erro ao processar {os.path.join(input_folder, filename)}: {error}")
+
+    cache.save()
+    print(
+        f"Convertidos: {converted}, ignorados (atualizados): {skipped}, falhas: {failed}"
+    )
+    return converted, skipped, failed
 
 
 def main():
@@ -82,13 +325,41 @@ def main():
     parser.add_argument(
         "--telhado", "-t", type=str, required=True, help="Número do telhado"
     )
+    parser.add_argument(
+        "--binario",
+        action="store_true",
+        help="Também grava cada tópico como série colunar binária (.serie)",
+    )
+    parser.add_argument(
+        "--tempo",
+        choices=["hm", "completo"],
+        default="hm",
+        help="Formato da coluna 'data': H:MM (padrão) ou data e hora completas com milissegundos",
+    )
+    parser.add_argument(
+        "--processos",
+        "-p",
+        type=int,
+        default=1,
+        help="Número de processos para converter os arquivos em paralelo",
+    )
+    add_force_argument(
+        parser, "Converte todos os arquivos, mesmo os que já estão atualizados"
+    )
 
     args = parser.parse_args()
 
     input_folder = f"simulacao{args.simulacao}/telhado{args.telhado}/json"
     output_folder = f"simulacao{args.simulacao}/telhado{args.telhado}/csv"
 
-    process_folder(input_folder, output_folder)
+    process_folder(
+        input_folder,
+        output_folder,
+        args.binario,
+        args.tempo,
+        args.processos,
+        args.forcar,
+    )
 
 
 if __name__ == "__main__":
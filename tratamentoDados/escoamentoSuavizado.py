@@ -0,0 +1,265 @@
+# Tratamento de Dados - Um exemplo de projeto Python
+# Copyright (C) 2024 Vinicius Patriarca Miranda Miguel
+
+# Este programa é software livre: você pode redistribuí-lo e/ou modificá-lo
+# sob os termos da Licença Pública Geral GNU como publicada pela Free Software
+# Foundation, tanto a versão 3 da Licença, como (a seu critério) qualquer versão posterior.
+
+# Este programa é distribuído na esperança de que seja útil,
+# mas SEM NENHUMA GARANTIA; sem mesmo a garantia implícita de
+# COMERCIABILIDADE ou ADEQUAÇÃO A UM DETERMINADO FIM. Veja a
+# Licença Pública Geral GNU para mais detalhes.
+
+# Você deve ter recebido uma cópia da Licença Pública Geral GNU
+# junto com este programa. Se não, veja <https://www.gnu.org/licenses/>.
+
+import argparse
+import glob
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from scipy.signal import savgol_filter
+
+import calculaEscoamento
+import leituraSerie
+from cacheDependencias import DependencyCache, add_force_argument, code_version
+from calculaEscoamento import UNIDADES_TEMPO, UNIDADES_VOLUME, load_geometry
+from leituraSerie import parse_time
+
+# Chave do lote no registro de dependências de cada diretório de saída
+CHAVE_LOTE = "EscoamentoSuavizadoPy"
+
+
+def level_files(simulacao, telhado=None):
+    # Arquivos de nível de água dos telhados da simulação (sem as saídas de
+    # escoamento), como pares (telhado, arquivo)
+    telhados = [f"telhado{telhado}"] if telhado else ["telhado*"]
+    files = []
+    for tel in telhados:
+        for input_file in glob.glob(f"simulacao{simulacao}/{tel}/csv/*NivelAgua*.csv"):
+            if not os.path.basename(input_file).startswith("Escoamento"):
+                roof = os.path.basename(os.path.dirname(os.path.dirname(input_file)))
+                files.append((roof[len("telhado") :], input_file))
+    return sorted(files)
+
+
+def _unique_mean(seconds, values):
+    # Média dos valores com o mesmo instante (comum no formato H:MM), para que
+    # a interpolação receba instantes estritamente crescentes
+    unique, inverse = np.unique(seconds, return_inverse=True)
+    sums = np.bincount(inverse, weights=values, minlength=len(unique))
+    counts = np.bincount(inverse, minlength=len(unique))
+    return unique, sums / counts
+
+
+def resample_batch(series, passo):
+    # Interpola todas as séries em uma grade regular comum com espaçamento de
+    # 'passo' segundos. Retorna a grade, a matriz (séries x grade) e a máscara
+    # dos pontos dentro do intervalo coberto por cada série. Fora desse
+    # intervalo a série é estendida com o valor da borda, apenas para o filtro.
+    origin = min(times.min() for times, _ in series)
+    end = max(times.max() for times, _ in series)
+    span = (end - origin) / np.timedelta64(1, "s")
+    grid_seconds = np.arange(0, span + passo / 2, passo)
+
+    matrix = np.empty((len(series), len(grid_seconds)))
+    inside = np.zeros(matrix.shape, dtype=bool)
+    for row, (times, values) in enumerate(series):
+        seconds = (times - origin) / np.timedelta64(1, "s")
+        valid = ~np.isnan(values)
+        seconds, values = _unique_mean(seconds[valid], values[valid])
+        matrix[row] = np.interp(grid_seconds, seconds, values)
+        inside[row] = (grid_seconds >= seconds[0]) & (grid_seconds <= seconds[-1])
+
+    grid = origin + (grid_seconds * 1e9).astype("timedelta64[ns]")
+    return grid, matrix, inside
+
+
+def smoothed_derivative(matrix, passo, janela=11, ordem=3):
+    # Derivada (por minuto) de cada linha, por ajuste polinomial local de
+    # Savitzky-Golay, em uma única chamada para todas as séries
+    n = matrix.shape[1]
+    if janela > n:
+        janela = n if n % 2 else n - 1
+    if janela <= ordem:
+        raise ValueError("Série curta demais para a janela e a ordem escolhidas")
+    return savgol_filter(
+        matrix, janela, ordem, deriv=1, delta=passo / 60, axis=1, mode="interp"
+    )
+
+
+def output_name(input_file):
+    # Arquivo de escoamento suavizado gravado ao lado do arquivo de nível
+    return os.path.join(
+        os.path.dirname(input_file),
+        f"EscoamentoSuavizadoPy_{os.path.basename(input_file)}",
+    )
+
+
+def read_level(input_file):
+    # Instantes e valores de um arquivo de nível
+    df = pd.read_csv(input_file)
+    times = parse_time(df["data"]).to_numpy(dtype="datetime64[ns]")
+    values = pd.to_numeric(df["body"], errors="coerce").to_numpy(dtype=float)
+    return times, values
+
+
+def process_roof(simulacao, roof, files, passo=60.0, janela=11, ordem=3, forcar=False):
+    # Calcula o escoamento suavizado dos arquivos de nível de um telhado. As
+    # séries do telhado são reamostradas juntas em uma grade que cobre apenas
+    # o intervalo do próprio telhado, então cada saída depende de todas as
+    # entradas do telhado: o lote é registrado como uma unidade no diretório
+    # de saída e refeito por inteiro se algo mudar.
+    geometry = load_geometry(simulacao, roof)
+    parametros = {
+        "passo": passo,
+        "janela": janela,
+        "ordem": ordem,
+        "entradas": files,
+        "geometria": geometry,
+    }
+    codigo = code_version(sys.modules[__name__], calculaEscoamento, leituraSerie)
+    cache = DependencyCache(os.path.dirname(files[0]), forcar)
+    if cache.is_up_to_date(CHAVE_LOTE, files, parametros, codigo):
+        outputs = [
+            output_name(input_file)
+            for input_file in files
+            if os.path.exists(output_name(input_file))
+        ]
+        for output_file in outputs:
+            print(f"Saída atualizada: {output_file}")
+        return outputs
+
+    # Um arquivo ilegível ou sem dados é informado e deixado de fora, sem
+    # interromper os demais
+    usable, series, errors = [], [], 0
+    for input_file in files:
+        try:
+            times, values = read_level(input_file)
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Erro ao processar {input_file}: {e}")
+            errors += 1
+            continue
+        valid = ~(np.isnan(values) | np.isnat(times))
+        if valid.sum() < 2:
+            print(f"Erro ao processar {input_file}: dados insuficientes")
+            errors += 1
+            continue
+        usable.append(input_file)
+        series.append((times[valid], values[valid]))
+
+    outputs = []
+    if usable:
+        grid, matrix, inside = resample_batch(series, passo)
+        try:
+            derivatives = smoothed_derivative(matrix, passo, janela, ordem)  # cm/min
+        except ValueError as e:
+            for input_file in usable:
+                print(f"Erro ao processar {input_file}: {e}")
+            errors += len(usable)
+            usable = []
+
+    area_seccao = np.pi * geometry["raio"] ** 2
+    fator = (
+        UNIDADES_VOLUME[geometry["unidade_volume"]]
+        * UNIDADES_TEMPO[geometry["unidade_tempo"]]
+    )
+    for row, input_file in enumerate(usable):
+        if inside[row].sum() <= ordem:
+            # A série cobre poucos pontos da grade do telhado: a derivada
+            # viria quase só da extensão pelas bordas
+            print(
+                f"Erro ao processar {input_file}: "
+                "Série curta demais para a janela e a ordem escolhidas"
+            )
+            errors += 1
+            continue
+        escoamento_df = pd.DataFrame(
+            {
+                "data": grid[inside[row]],
+                "body": derivatives[row][inside[row]] * area_seccao * fator,
+            }
+        )
+        output_file = output_name(input_file)
+        escoamento_df.to_csv(output_file, index=False)
+        print(f"Escoamento suavizado salvo em {output_file}")
+        outputs.append(output_file)
+
+    # Com erros, o lote não é registrado, para ser refeito (e os erros
+    # informados de novo) na próxima execução
+    if errors:
+        cache.forget(CHAVE_LOTE)
+    else:
+        cache.record(CHAVE_LOTE, files, parametros, codigo, outputs)
+    cache.save()
+    return outputs
+
+
+def process_simulation(
+    simulacao, telhado=None, passo=60.0, janela=11, ordem=3, forcar=False
+):
+    # Calcula o escoamento suavizado de todos os arquivos de nível da
+    # simulação, um lote por telhado
+    files = level_files(simulacao, telhado)
+    if not files:
+        print("Nenhum arquivo de nível encontrado.")
+        return []
+
+    roofs = {}
+    for roof, input_file in files:
+        roofs.setdefault(roof, []).append(input_file)
+
+    outputs = []
+    for roof, roof_files in roofs.items():
+        outputs += process_roof(
+            simulacao, roof, roof_files, passo, janela, ordem, forcar
+        )
+    return outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Calcula o escoamento suavizado (Savitzky-Golay) a partir dos níveis de água"
+    )
+    parser.add_argument(
+        "--simulacao", "-s", type=str, required=True, help="Número da simulação"
+    )
+    parser.add_argument(
+        "--telhado",
+        "-t",
+        type=str,
+        help="Número do telhado (padrão: todos os telhados da simulação)",
+    )
+    parser.add_argument(
+        "--passo",
+        type=float,
+        default=60.0,
+        help="Espaçamento da grade de reamostragem em segundos",
+    )
+    parser.add_argument(
+        "--janela",
+        type=int,
+        default=11,
+        help="Tamanho (ímpar) da janela do filtro em pontos da grade",
+    )
+    parser.add_argument("--ordem", type=int, default=3, help="Ordem do polinômio local")
+    add_force_argument(
+        parser, "Recalcula o escoamento mesmo que as saídas já estejam atualizadas"
+    )
+
+    args = parser.parse_args()
+
+    process_simulation(
+        args.simulacao,
+        args.telhado,
+        args.passo,
+        args.janela,
+        args.ordem,
+        args.forcar,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+# Tratamento de Dados - Um exemplo de projeto Python
+# Copyright (C) 2024 Vinicius Patriarca Miranda Miguel
+
+# Este programa é software livre: você pode redistribuí-lo e/ou modificá-lo
+# sob os termos da Licença Pública Geral GNU como publicada pela Free Software
+# Foundation, tanto a versão 3 da Licença, como (a seu critério) qualquer versão posterior.
+
+# Este programa é distribuído na esperança de que seja útil,
+# mas SEM NENHUMA GARANTIA; sem mesmo a garantia implícita de
+# COMERCIABILIDADE ou ADEQUAÇÃO A UM DETERMINADO FIM. Veja a
+# Licença Pública Geral GNU para mais detalhes.
+
+# Você deve ter recebido uma cópia da Licença Pública Geral GNU
+# junto com este programa. Se não, veja <https://www.gnu.org/licenses/>.
+
+import argparse
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+from alinhamento import PASSO_PADRAO, align_simulation
+from calculaEscoamento import load_geometry
+from leituraSerie import NIVEL, VOLUME, series_with_suffix
+
+# Tempo seco mínimo entre eventos (em minutos), altura mínima de um evento (em
+# mm) e chuva mínima em um intervalo da grade para considerá-lo chuvoso
+SECA_PADRAO = 360.0
+MINIMO_PADRAO = 0.2
+LIMIAR_PADRAO = 0.0
+
+COLUNAS = [
+    "simulacao",
+    "evento",
+    "telhado",
+    "inicio",
+    "fim",
+    "duracao(min)",
+    "chuva(mm)",
+    "intensidade_max(mm/h)",
+    "volume_escoado(cm3)",
+    "vazao_pico(cm3/min)",
+    "coeficiente_escoamento",
+]
+
+
+def simulations():
+    # Números de todas as simulações do diretório atual
+    numbers = [
+        d[len("simulacao") :] for d in glob.glob("simulacao*") if os.path.isdir(d)
+    ]
+    return sorted(numbers, key=lambda n: (len(n), n))
+
+
+def segment_events(
+    chuva, passo, seca=SECA_PADRAO, minimo=MINIMO_PADRAO, limiar=LIMIAR_PADRAO
+):
+    # Separa a série de chuva (mm por intervalo da grade) em eventos: intervalos
+    # chuvosos separados por menos de 'seca' minutos pertencem ao mesmo evento.
+    # Retorna os índices do primeiro e do último intervalo chuvoso de cada
+    # evento com pelo menos 'minimo' mm.
+    chuva = np.nan_to_num(np.asarray(chuva, dtype=float))
+    chuvosos = np.flatnonzero(chuva > limiar)
+    if len(chuvosos) == 0:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+
+    novo = np.r_[True, np.diff(chuvosos) * passo / 60 > seca]
+    inicios = chuvosos[novo]
+    ultimos = chuvosos[np.r_[novo[1:], True]]
+
+    acumulada = np.r_[0.0, np.cumsum(chuva)]
+    altura = acumulada[ultimos + 1] - acumulada[inicios]
+    manter = altura >= minimo
+    return inicios[manter], ultimos[manter]
+
+
+def event_windows(
+    chuva,
+    passo,
+    seca=SECA_PADRAO,
+    minimo=MINIMO_PADRAO,
+    limiar=LIMIAR_PADRAO,
+    cauda=None,
+):
+    # Eventos de chuva como índices (início, última chuva, fim). O escoamento
+    # de um evento é acompanhado até 'cauda' minutos (padrão: 'seca') depois
+    # da última chuva, sem invadir o evento seguinte.
+    inicios, ultimos = segment_events(chuva, passo, seca, minimo, limiar)
+    n = len(chuva)
+    cauda_pontos = int(round((seca if cauda is None else cauda) * 60 / passo))
+    fins = np.minimum(ultimos + cauda_pontos, n - 1)
+    fins = np.minimum(fins, np.r_[inicios[1:] - 1, n - 1])
+    return inicios, ultimos, fins
+
+
+def rain_series(df):
+    # Chuva (mm por intervalo da grade) do quadro alinhado, ou None se não
+    # houver. O pluviômetro é o mesmo para todos os telhados.
+    colunas_chuva = [c for c in df.columns if "Milimetros" in c]
+    if not colunas_chuva:
+        return None
+    with np.errstate(all="ignore"):
+        chuva = np.nanmean(df[colunas_chuva].to_numpy(dtype=float), axis=1)
+    return np.nan_to_num(chuva)
+
+
+def _window_reduce(ufunc, values, inicios, fins):
+    # Aplica ufunc.reduceat em janelas [início, fim] disjuntas e ordenadas, em
+    # todas as colunas de uma vez
+    padded = np.concatenate([values, values[-1:]], axis=0)
+    indices = np.column_stack([inicios, fins + 1]).ravel()
+    return ufunc.reduceat(padded, indices, axis=0)[::2]
+
+
+def roof_volumes(simulacao, df):
+    # Volume armazenado em cada telhado (cm³) na grade do quadro alinhado: o
+    # tópico terminado em Volume(cm3) ou, na falta dele, o nível de água vezes
+    # a área da seção do galão. Os tópicos do firmware têm um prefixo (por
+    # exemplo ic_escoamentoTelhado-1_Volume(cm3)).
+    topicos = {}
+    for column in df.columns:
+        roof, _, topic = column.partition("/")
+        topicos.setdefault(roof[len("telhado") :], {})[topic] = column
+
+    volumes = {}
+    for telhado, colunas in topicos.items():
+        volume = series_with_suffix(colunas, VOLUME)
+        nivel = series_with_suffix(colunas, NIVEL)
+        if volume:
+            volumes[telhado] = df[colunas[volume[-1]]]
+        elif nivel:
+            raio = load_geometry(simulacao, telhado)["raio"]
+            volumes[telhado] = df[colunas[nivel[-1]]] * np.pi * raio**2
+    return dict(sorted(volumes.items()))
+
+
+def simulation_events(
+    simulacao,
+    passo=PASSO_PADRAO,
+    seca=SECA_PADRAO,
+    minimo=MINIMO_PADRAO,
+    limiar=LIMIAR_PADRAO,
+    cauda=None,
+    area=None,
+):
+    # Tabela de eventos de uma simulação, com uma linha por evento e telhado
+    df = align_simulation(simulacao, passo=passo)
+    chuva = rain_series(df)
+    volumes = roof_volumes(simulacao, df)
+    if chuva is None or not volumes:
+        print(f"Simulação {simulacao}: sem dados de chuva ou de volume.")
+        return pd.DataFrame(columns=COLUNAS)
+
+    inicios, ultimos, fins = event_windows(chuva, passo, seca, minimo, limiar, cauda)
+    if len(inicios) == 0:
+        print(f"Simulação {simulacao}: nenhum evento de chuva.")
+        return pd.DataFrame(columns=COLUNAS)
+
+    # Matriz (grade x telhados) de volumes, com lacunas preenchidas pela
+    # leitura anterior (ou pela primeira, no início da série)
+    telhados = list(volumes)
+    volume = pd.DataFrame(volumes).ffill().bfill().to_numpy(dtype=float)
+    vazao = np.diff(volume, axis=0, prepend=volume[:1]) * 60 / passo  # cm³/min
+
+    antes = np.maximum(inicios - 1, 0)
+    volume_escoado = volume[fins] - volume[antes]
+    vazao_pico = _window_reduce(np.fmax, vazao, inicios, fins)
+
+    acumulada = np.r_[0.0, np.cumsum(chuva)]
+    altura = acumulada[ultimos + 1] - acumulada[inicios]
+    intensidade = _window_reduce(np.maximum, chuva, inicios, ultimos) * 3600 / passo
+
+    # Coeficiente de escoamento: lâmina escoada / altura de chuva, com a área
+    # do telhado em m² (argumento ou "area_telhado" no tanque.json)
+    areas = np.array(
+        [
+            (
+                area
+                if area is not None
+                else load_geometry(simulacao, t).get("area_telhado", np.nan)
+            )
+            for t in telhados
+        ],
+        dtype=float,
+    )
+    lamina = volume_escoado / (areas * 1e4) * 10  # cm³ / cm² -> cm -> mm
+    with np.errstate(divide="ignore", invalid="ignore"):
+        coeficiente = lamina / altura[:, None]
+
+    datas = df["data"].to_numpy()
+    n_eventos, n_telhados = volume_escoado.shape
+    evento = np.repeat(np.arange(1, n_eventos + 1), n_telhados)
+    linha = np.repeat(np.arange(n_eventos), n_telhados)
+    return pd.DataFrame(
+        {
+            "simulacao": simulacao,
+            "evento": evento,
+            "telhado": np.tile(telhados, n_eventos),
+            "inicio": datas[inicios][linha],
+            "fim": datas[fins][linha],
+            "duracao(min)": ((ultimos - inicios + 1) * passo / 60)[linha],
+            "chuva(mm)": altura[linha],
+            "intensidade_max(mm/h)": intensidade[linha],
+            "volume_escoado(cm3)": volume_escoado.ravel(),
+            "vazao_pico(cm3/min)": vazao_pico.ravel(),
+            "coeficiente_escoamento": coeficiente.ravel(),
+        },
+        columns=COLUNAS,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Separa os eventos de chuva e calcula o escoamento de cada telhado"
+    )
+    parser.add_argument(
+        "--simulacao",
+        "-s",
+        type=str,
+        nargs="*",
+        help="Números das simulações (padrão: todas as do diretório atual)",
+    )
+    parser.add_argument(
+        "--passo",
+        type=float,
+        default=PASSO_PADRAO,
+        help="Espaçamento da grade em segundos",
+    )
+    parser.add_argument(
+        "--seca",
+        type=float,
+        default=SECA_PADRAO,
+        help="Tempo seco mínimo entre eventos em minutos",
+    )
+    parser.add_argument(
+        "--minimo",
+        type=float,
+        default=MINIMO_PADRAO,
+        help="Altura mínima de chuva de um evento em mm",
+    )
+    parser.add_argument(
+        "--limiar",
+        type=float,
+        default=LIMIAR_PADRAO,
+        help="Chuva mínima (mm) em um intervalo da grade para considerá-lo chuvoso",
+    )
+    parser.add_argument(
+        "--cauda",
+        type=float,
+        help="Minutos após a última chuva em que o escoamento é contabilizado (padrão: --seca)",
+    )
+    parser.add_argument(
+        "--area",
+        type=float,
+        help="Área do telhado em m² (padrão: area_telhado do tanque.json)",
+    )
+    parser.add_argument(
+        "--saida",
+        "-o",
+        type=str,
+        default="eventosChuva.csv",
+        help="Arquivo CSV de saída",
+    )
+
+    args = parser.parse_args()
+
+    tabelas = [
+        simulation_events(
+            simulacao,
+            args.passo,
+            args.seca,
+            args.minimo,
+            args.limiar,
+            args.cauda,
+            args.area,
+        )
+        for simulacao in (args.simulacao or simulations())
+    ]
+    tabela = (
+        pd.concat(tabelas, ignore_index=True)
+        if tabelas
+        else pd.DataFrame(columns=COLUNAS)
+    )
+    tabela.to_csv(args.saida, index=False)
+    print(
+        f"{tabela['evento'].count()} linhas (evento x telhado) salvas em {args.saida}"
+    )
+
+
+if __name__ == "__main__":
+    main()
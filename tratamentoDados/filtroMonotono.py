@@ -0,0 +1,165 @@
+# Tratamento de Dados - Um exemplo de projeto Python
+# Copyright (C) 2024 Vinicius Patriarca Miranda Miguel
+
+# Este programa é software livre: você pode redistribuí-lo e/ou modificá-lo
+# sob os termos da Licença Pública Geral GNU como publicada pela Free Software
+# Foundation, tanto a versão 3 da Licença, como (a seu critério) qualquer versão posterior.
+
+# Este programa é distribuído na esperança de que seja útil,
+# mas SEM NENHUMA GARANTIA; sem mesmo a garantia implícita de
+# COMERCIABILIDADE ou ADEQUAÇÃO A UM DETERMINADO FIM. Veja a
+# Licença Pública Geral GNU para mais detalhes.
+
+# Você deve ter recebido uma cópia da Licença Pública Geral GNU
+# junto com este programa. Se não, veja <https://www.gnu.org/licenses/>.
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import isotonic_regression
+
+# Pesos da regressão isotônica: todos iguais, ou o intervalo de tempo que
+# cada amostra representa
+PESOS = ("uniforme", "intervalo")
+
+
+def _hysteresis_updates(values, hysteresis):
+    # Índices em que a referência é atualizada: a partir da referência atual,
+    # o próximo ponto que a supera em pelo menos 'hysteresis'. Como o máximo
+    # acumulado é não decrescente, cada salto é encontrado com uma busca
+    # binária; o laço percorre apenas as atualizações, não todos os pontos.
+    running_max = np.maximum.accumulate(values)
+    updates = [0]
+    while True:
+        j = np.searchsorted(running_max, values[updates[-1]] + hysteresis, "left")
+        if j >= len(values):
+            return np.array(updates)
+        updates.append(j)
+
+
+def monotone_mask(values, direction="forward", tolerance=0.0, hysteresis=0.0):
+    """Máscara dos pontos que formam uma série monótona.
+
+    Equivale a percorrer a série mantendo uma referência, inicialmente o
+    primeiro valor, e manter cada ponto que não fique abaixo dela: com
+    direction="forward" a série resultante é não decrescente (nível de água);
+    com direction="backward" a série é percorrida do fim para o início
+    (volume). Pontos até 'tolerance' abaixo da referência também são mantidos
+    e, com 'hysteresis', a referência só sobe quando um ponto a supera em
+    pelo menos esse valor. Valores NaN nunca são mantidos.
+    """
+    values = np.asarray(values, dtype=float)
+    if direction == "backward":
+        return monotone_mask(values[::-1], "forward", tolerance, hysteresis)[::-1]
+    if direction != "forward":
+        raise ValueError(f"Direção inválida: {direction}")
+
+    n = len(values)
+    # Sem um valor inicial válido nenhuma comparação é verdadeira
+    if n == 0 or np.isnan(values[0]):
+        return np.zeros(n, dtype=bool)
+
+    filled = np.where(np.isnan(values), -np.inf, values)
+
+    # Referência vigente antes de cada ponto
+    reference = np.empty(n)
+    reference[0] = filled[0]
+    if hysteresis > 0:
+        updates = _hysteresis_updates(filled, hysteresis)
+        last_update = updates[np.searchsorted(updates, np.arange(n), "left") - 1]
+        reference[1:] = filled[last_update[1:]]
+    else:
+        # Pontos descartados ficam abaixo da referência, então ela é o máximo
+        # acumulado de todos os pontos anteriores
+        reference[1:] = np.maximum.accumulate(filled)[:-1]
+
+    with np.errstate(invalid="ignore"):
+        return values >= reference - tolerance
+
+
+def interval_weights(seconds):
+    """Peso de cada amostra proporcional ao intervalo de tempo que ela representa.
+
+    Cada instante distinto recebe metade da distância até o instante anterior
+    mais metade da distância até o seguinte, dividida igualmente entre as
+    amostras desse instante. Assim, uma rajada de leituras em poucos segundos
+    não pesa mais no ajuste do que um trecho longo com poucas leituras.
+    Instantes NaN recebem peso NaN (e ficam fora do ajuste).
+    """
+    seconds = np.asarray(seconds, dtype=float)
+    weights = np.full(len(seconds), np.nan)
+    valid = ~np.isnan(seconds)
+    instants, inverse, counts = np.unique(
+        seconds[valid], return_inverse=True, return_counts=True
+    )
+    if len(instants) < 2:
+        weights[valid] = 1.0
+        return weights
+
+    gaps = np.diff(instants)
+    span = np.empty(len(instants))
+    span[0] = gaps[0] / 2
+    span[-1] = gaps[-1] / 2
+    span[1:-1] = (gaps[:-1] + gaps[1:]) / 2
+    weights[valid] = span[inverse] / counts[inverse]
+    return weights
+
+
+def correction_weights(times, pesos="uniforme"):
+    # Pesos da regressão isotônica para os instantes (datetime) de uma série,
+    # ou None para pesos iguais
+    if pesos == "uniforme":
+        return None
+    if pesos != "intervalo":
+        raise ValueError(f"Pesos inválidos: {pesos}")
+    times = pd.Series(times)
+    return interval_weights((times - times.min()).dt.total_seconds().to_numpy())
+
+
+def _numeric_column(df, column):
+    # Valores da coluna como float; textos que não são números (como o "Erro"
+    # que o firmware publica quando o volume é negativo) viram NaN
+    return pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=float)
+
+
+def monotone_filter(
+    df, column="body", direction="forward", tolerance=0.0, hysteresis=0.0
+):
+    # Mantém apenas as linhas do DataFrame que formam uma série monótona; as
+    # linhas sem valor numérico são descartadas
+    mask = monotone_mask(_numeric_column(df, column), direction, tolerance, hysteresis)
+    return df[mask]
+
+
+def isotonic_fit(values, direction="forward", weights=None):
+    """Regressão isotônica (pool-adjacent-violators) de uma série.
+
+    Em vez de descartar pontos, substitui os valores pela série monótona mais
+    próxima no sentido dos mínimos quadrados (ponderados por 'weights'), não
+    decrescente com direction="forward" e não crescente com "backward", como
+    as séries que o filtro mantém. Valores NaN não participam do ajuste e
+    continuam NaN no resultado.
+    """
+    values = np.asarray(values, dtype=float)
+    if direction not in ("forward", "backward"):
+        raise ValueError(f"Direção inválida: {direction}")
+
+    valid = ~np.isnan(values)
+    if weights is not None:
+        weights = np.asarray(weights, dtype=float)
+        valid &= ~np.isnan(weights)
+        weights = weights[valid]
+
+    fitted = np.full(len(values), np.nan)
+    if valid.any():
+        fitted[valid] = isotonic_regression(
+            values[valid], weights=weights, increasing=direction == "forward"
+        ).x
+    return fitted
+
+
+def isotonic_correction(df, column="body", direction="forward", weights=None):
+    # Substitui a coluna pela regressão isotônica, mantendo todas as linhas;
+    # as linhas sem valor numérico ficam com NaN
+    df = df.copy()
+    df[column] = isotonic_fit(_numeric_column(df, column), direction, weights)
+    return df
@@ -0,0 +1,228 @@
+# Tratamento de Dados - Um exemplo de projeto Python
+# Copyright (C) 2024 Vinicius Patriarca Miranda Miguel
+
+# Este programa é software livre: você pode redistribuí-lo e/ou modificá-lo
+# sob os termos da Licença Pública Geral GNU como publicada pela Free Software
+# Foundation, tanto a versão 3 da Licença, como (a seu critério) qualquer versão posterior.
+
+# Este programa é distribuído na esperança de que seja útil,
+# mas SEM NENHUMA GARANTIA; sem mesmo a garantia implícita de
+# COMERCIABILIDADE ou ADEQUAÇÃO A UM DETERMINADO FIM. Veja a
+# Licença Pública Geral GNU para mais detalhes.
+
+# Você deve ter recebido uma cópia da Licença Pública Geral GNU
+# junto com este programa. Se não, veja <https://www.gnu.org/licenses/>.
+
+import argparse
+import glob
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from cacheDependencias import DependencyCache, add_force_argument, code_version
+
+# Padrões dos arquivos de nível processados em lote
+INPUT_PATTERNS = ["*NivelAgua*.csv", "*DistanciaAgua*.csv"]
+
+# Sufixo inserido no nome dos arquivos de saída
+OUTPUT_SUFFIX = "SemPicos"
+
+# Número de pontos processados por vez, para limitar a memória das janelas
+BLOCK_SIZE = 1 << 18
+
+# Fator que torna o MAD um estimador do desvio padrão para dados normais
+MAD_SCALE = 1.4826
+
+
+def rolling_median(values, janela, mad=False):
+    # Mediana (e, opcionalmente, o MAD) de uma janela centrada em cada ponto,
+    # calculada com janelas deslizantes do NumPy. As bordas são completadas por
+    # reflexão e a série é processada em blocos para limitar a memória.
+    half = janela // 2
+    padded = np.pad(values, half, mode="reflect") if len(values) > half else values
+    medians = np.empty(len(values))
+    deviations = np.empty(len(values)) if mad else None
+
+    for start in range(0, len(values), BLOCK_SIZE):
+        stop = min(start + BLOCK_SIZE, len(values))
+        windows = sliding_window_view(padded[start : stop + 2 * half], janela)
+        # Com janela ímpar a mediana é o elemento central, obtido com
+        # np.partition (bem mais rápido que np.median ao longo de um eixo)
+        block_medians = np.partition(windows, half, axis=1)[:, half]
+        medians[start:stop] = block_medians
+        if mad:
+            deviations[start:stop] = np.partition(
+                np.abs(windows - block_medians[:, None]), half, axis=1
+            )[:, half]
+
+    return medians, deviations
+
+
+def spike_mask(values, janela=7, limiar=3.0, metodo="hampel"):
+    # Marca os picos de uma série. No filtro de Hampel um ponto é pico quando
+    # se afasta da mediana da janela mais que 'limiar' desvios (estimados pelo
+    # MAD); no filtro de mediana, quando se afasta mais que 'limiar' unidades.
+    # Os valores NaN ficam fora das janelas e nunca são marcados. Retorna a
+    # máscara dos picos e a mediana de cada janela (o próprio valor nos NaN).
+    values = np.asarray(values, dtype=float)
+    if janela < 3 or janela % 2 == 0:
+        raise ValueError("A janela deve ser um número ímpar maior ou igual a 3")
+    if metodo not in ("hampel", "mediana"):
+        raise ValueError(f"Método inválido: {metodo}")
+
+    mask = np.zeros(len(values), dtype=bool)
+    medians = values.copy()
+    valid = ~np.isnan(values)
+    numbers = values[valid]
+    if len(numbers) < janela:
+        return mask, medians
+
+    window_medians, deviations = rolling_median(numbers, janela, mad=metodo == "hampel")
+    if metodo == "hampel":
+        threshold = limiar * MAD_SCALE * deviations
+    else:
+        threshold = limiar
+
+    mask[valid] = np.abs(numbers - window_medians) > threshold
+    medians[valid] = window_medians
+    return mask, medians
+
+
+def output_name(file_name):
+    # "NivelAgua(cm).csv" -> "NivelAguaSemPicos(cm).csv"
+    base = os.path.splitext(file_name)[0]
+    if "(" in base:
+        index = base.index("(")
+        return base[:index] + OUTPUT_SUFFIX + base[index:] + ".csv"
+    return base + OUTPUT_SUFFIX + ".csv"
+
+
+def process_csv(
+    input_file, output_file, janela=7, limiar=3.0, metodo="hampel", remover=False
+):
+    # Ler o arquivo CSV
+    df = pd.read_csv(input_file)
+    values = pd.to_numeric(df["body"], errors="coerce").to_numpy(dtype=float)
+
+    mask, medians = spike_mask(values, janela, limiar, metodo)
+
+    if remover:
+        # Descartar os picos
+        df = df[~mask]
+    elif pd.api.types.is_numeric_dtype(df["body"]):
+        # Substituir cada pico pela mediana da sua janela
+        df["body"] = np.where(mask, medians, values)
+    else:
+        # Só os picos são substituídos; as linhas cujo body não é um número
+        # são copiadas sem mudança
+        body = df["body"].to_numpy(dtype=object)
+        body[mask] = medians[mask]
+        df["body"] = body
+
+    df.to_csv(output_file, index=False)
+    return int(mask.sum()), len(values)
+
+
+def input_files(simulacao, telhado=None):
+    # Todos os arquivos de nível e distância dos telhados da simulação, sem
+    # os arquivos derivados (escoamento e saídas deste filtro)
+    telhados = [f"telhado{telhado}"] if telhado else ["telhado*"]
+    files = []
+    for pattern in INPUT_PATTERNS:
+        for tel in telhados:
+            files += glob.glob(f"simulacao{simulacao}/{tel}/csv/{pattern}")
+
+    return sorted(
+        file
+        for file in set(files)
+        if OUTPUT_SUFFIX not in file
+        and not os.path.basename(file).startswith("Escoamento")
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Remove picos das séries de nível e distância da água de uma simulação"
+    )
+    parser.add_argument(
+        "--simulacao", "-s", type=str, required=True, help="Número da simulação"
+    )
+    parser.add_argument(
+        "--telhado",
+        "-t",
+        type=str,
+        help="Número do telhado (padrão: todos os telhados da simulação)",
+    )
+    parser.add_argument(
+        "--janela",
+        type=int,
+        default=7,
+        help="Tamanho (ímpar) da janela em número de pontos",
+    )
+    parser.add_argument(
+        "--limiar",
+        type=float,
+        default=3.0,
+        help="Hampel: número de desvios (MAD); mediana: distância máxima à mediana",
+    )
+    parser.add_argument(
+        "--metodo", choices=["hampel", "mediana"], default="hampel", help="Filtro"
+    )
+    parser.add_argument(
+        "--remover",
+        action="store_true",
+        help="Descarta os picos em vez de substituí-los pela mediana da janela",
+    )
+    add_force_argument(
+        parser, "Filtra todos os arquivos, mesmo os que já estão atualizados"
+    )
+
+    args = parser.parse_args()
+
+    parametros = {
+        "janela": args.janela,
+        "limiar": args.limiar,
+        "metodo": args.metodo,
+        "remover": args.remover,
+    }
+    codigo = code_version(sys.modules[__name__])
+    caches = {}
+
+    total_flagged = total_points = 0
+    for input_file in input_files(args.simulacao, args.telhado):
+        output_dir = os.path.dirname(input_file)
+        output_file = os.path.join(
+            output_dir, output_name(os.path.basename(input_file))
+        )
+        if output_dir not in caches:
+            caches[output_dir] = DependencyCache.from_args(output_dir, args)
+        cache = caches[output_dir]
+        chave = os.path.basename(output_file)
+        if cache.is_up_to_date(chave, [input_file], parametros, codigo):
+            print(f"Saída atualizada: {output_file}")
+            continue
+
+        flagged, points = process_csv(
+            input_file,
+            output_file,
+            args.janela,
+            args.limiar,
+            args.metodo,
+            args.remover,
+        )
+        cache.record(chave, [input_file], parametros, codigo, [output_file])
+        total_flagged += flagged
+        total_points += points
+        print(f"{input_file}: {flagged} de {points} pontos marcados -> {output_file}")
+
+    for cache in caches.values():
+        cache.save()
+
+    print(f"Total: {total_flagged} de {total_points} pontos marcados como picos")
+
+
+if __name__ == "__main__":
+    main()
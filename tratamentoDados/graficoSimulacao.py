@@ -14,13 +14,28 @@
 # junto com este programa. Se não, veja <https://www.gnu.org/licenses/>.
 
 import argparse
+import multiprocessing
 import os
+import sys
 
-import matplotlib.pyplot as plt
+import matplotlib
 import pandas as pd
 
-
-def plot_csv(simulacao, telhado, file_name, output_dir):
+import leituraSerie
+import renderizacao
+from cacheDependencias import DependencyCache, add_force_argument, code_version
+from leituraSerie import parse_time
+from renderizacao import MAX_PONTOS_PADRAO, add_decimation_arguments, template
+
+
+def plot_csv(
+    simulacao,
+    telhado,
+    file_name,
+    output_dir,
+    max_pontos=MAX_PONTOS_PADRAO,
+    decimacao="lttb",
+):
     # Constrói o caminho completo do arquivo de entrada
     input_file = f"simulacao{simulacao}/telhado{telhado}/csv/{file_name}"
 
@@ -32,8 +47,18 @@ def plot_csv(simulacao, telhado, file_name, output_dir):
         print(f"O arquivo {input_file} deve ter pelo menos duas colunas.")
         return
 
-    # Converte a coluna de data para datetime, considerando apenas hora e minuto
-    data["Hora_Minuto"] = pd.to_datetime(data["data"], format="%H:%M")
+    return plot_frame(data, file_name, output_dir, max_pontos, decimacao)
+
+
+def plot_frame(
+    data, file_name, output_dir, max_pontos=MAX_PONTOS_PADRAO, decimacao="lttb"
+):
+    # Gera o gráfico de uma série já carregada (colunas 'data' e valores),
+    # salvo como file_name com a extensão .png
+    data = data.copy()
+
+    # Converte a coluna de data para datetime (H:MM ou data e hora completas)
+    data["Hora_Minuto"] = parse_time(data["data"])
 
     # Ajusta o primeiro tempo para ser 0
     min_time = data["Hora_Minuto"].min()
@@ -52,44 +77,41 @@ def plot_csv(simulacao, telhado, file_name, output_dir):
     # Extrai o nome do arquivo para usar como rótulo do eixo y
     y_label = os.path.splitext(file_name)[0]  # Remove a extensão .csv
 
-    # Plota os dados
-    plt.figure(figsize=(20, 5))
-    plt.plot(data["Hora_Minuto"], data[value_column_name], marker="o")
-
     # Define os rótulos do eixo x como HH:MM a cada 10 minutos
     max_time = data["Hora_Minuto"].max()
     if pd.isna(max_time):
         print(f"Não foi possível determinar o máximo tempo válido em {file_name}.")
         return
 
-    max_time_minutes = max_time * 60  # Converte para minutos
-    interval = 10  # Intervalo de 10 minutos para os ticks
-    ticks = range(
-        0, int(max_time_minutes) + interval, interval
-    )  # Cria ticks a cada 10 minutos
-    x_labels = [f"{tick//60:02d}:{tick%60:02d}" for tick in ticks]
-    ticks_hours = [
-        tick / 60 for tick in ticks
-    ]  # Converte ticks de volta para horas decimais
-
-    plt.xticks(ticks=ticks_hours, labels=x_labels, rotation=45)
-
-    plt.xlabel("Tempo (Horas:Minutos)")
-    plt.ylabel(y_label)  # Usa o nome do arquivo como rótulo do eixo y
-    plt.title(f"Gráfico de Hora vs {y_label}")
-    plt.grid(True)
-    plt.tight_layout()
-
-    # Ajusta a distância entre as marcações no eixo x
-    ax = plt.gca()
-    ax.set_xticks(ticks_hours)
-
-    # Salva o gráfico no caminho de saída
+    # Plota os dados no template compartilhado: a figura é montada uma única
+    # vez por processo, sem o estado global do pyplot
     output_path = os.path.join(output_dir, file_name.replace(".csv", ".png"))
-    plt.savefig(output_path)
-    plt.close()
+    return template("serie", [(None, {"marker": "o"})], tight_layout=True).render(
+        output_path,
+        [(data["Hora_Minuto"], data[value_column_name])],
+        max_time,
+        "Tempo (Horas:Minutos)",
+        y_label,  # Usa o nome do arquivo como rótulo do eixo y
+        f"Gráfico de Hora vs {y_label}",
+        max_pontos=max_pontos,
+        decimacao=decimacao,
+    )
+
 
-    return output_path
+def _init_worker():
+    # Os processos do pool só gravam arquivos, sem janelas
+    matplotlib.use("Agg")
+
+
+def _plot_file(job):
+    # Executado em um processo do pool: gera um gráfico e devolve o erro em vez
+    # de interromper o lote. Qualquer erro de um arquivo malformado (por
+    # exemplo, um ParserError do pandas) só descarta esse arquivo.
+    file_name = job[2]
+    try:
+        return file_name, plot_csv(*job), None
+    except Exception as e:
+        return file_name, None, f"{type(e).__name__}: {e}"
 
 
 def main():
@@ -103,6 +125,20 @@ def main():
         "--telhado", "-t", type=str, required=True, help="Número do telhado"
     )
 
+    parser.add_argument(
+        "--processos",
+        "--jobs",
+        "-p",
+        type=int,
+        default=1,
+        help="Número de processos para gerar os gráficos em paralelo",
+    )
+    add_force_argument(
+        parser, "Gera todos os gráficos, mesmo os que já estão atualizados"
+    )
+
+    add_decimation_arguments(parser)
+
     args = parser.parse_args()
 
     input_dir = f"simulacao{args.simulacao}/telhado{args.telhado}/csv/"
@@ -111,11 +147,58 @@ def main():
     # Certifica-se de que o diretório de saída existe
     os.makedirs(output_dir, exist_ok=True)
 
-    # Processa todos os arquivos CSV na pasta de entrada
-    for file_name in os.listdir(input_dir):
-        if file_name.endswith(".csv"):
-            plot_csv(args.simulacao, args.telhado, file_name, output_dir)
-            print(f'Gráfico salvo em {output_dir}/{file_name.replace(".csv", ".png")}')
+    # Gráficos cujo CSV, opções e código não mudaram não são gerados de novo
+    cache = DependencyCache.from_args(output_dir, args)
+    parametros = {
+        "max_pontos": args.max_pontos,
+        "decimacao": args.decimacao,
+        "matplotlib": matplotlib.__version__,
+    }
+    codigo = code_version(sys.modules[__name__], renderizacao, leituraSerie)
+
+    # Processa os arquivos CSV da pasta de entrada, em paralelo se solicitado
+    jobs = []
+    skipped = 0
+    for file_name in sorted(os.listdir(input_dir)):
+        if not file_name.endswith(".csv"):
+            continue
+        if cache.is_up_to_date(file_name, [input_dir + file_name], parametros, codigo):
+            skipped += 1
+            continue
+        jobs.append(
+            (
+                args.simulacao,
+                args.telhado,
+                file_name,
+                output_dir,
+                args.max_pontos,
+                args.decimacao,
+            )
+        )
+    if args.processos > 1 and len(jobs) > 1:
+        with multiprocessing.Pool(
+            min(args.processos, len(jobs)), initializer=_init_worker
+        ) as pool:
+            results = list(pool.imap_unordered(_plot_file, jobs))
+    else:
+        results = map(_plot_file, jobs)
+
+    failed = 0
+    for file_name, output_path, error in results:
+        if error is not None:
+            failed += 1
+            print(f"Erro ao gerar o gráfico de {input_dir}{file_name}: {error}")
+        elif output_path is not None:
+            cache.record(
+                file_name, [input_dir + file_name], parametros, codigo, [output_path]
+            )
+            print(f"Gráfico salvo em {output_path}")
+
+    cache.save()
+    if skipped:
+        print(f"Gráficos atualizados (ignorados): {skipped}")
+    if failed:
+        print(f"Gráficos com falha: {failed} de {len(jobs)}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,189 @@
+# Tratamento de Dados - Um exemplo de projeto Python
+# Copyright (C) 2024 Vinicius Patriarca Miranda Miguel
+
+# Este programa é software livre: você pode redistribuí-lo e/ou modificá-lo
+# sob os termos da Licença Pública Geral GNU como publicada pela Free Software
+# Foundation, tanto a versão 3 da Licença, como (a seu critério) qualquer versão posterior.
+
+# Este programa é distribuído na esperança de que seja útil,
+# mas SEM NENHUMA GARANTIA; sem mesmo a garantia implícita de
+# COMERCIABILIDADE ou ADEQUAÇÃO A UM DETERMINADO FIM. Veja a
+# Licença Pública Geral GNU para mais detalhes.
+
+# Você deve ter recebido uma cópia da Licença Pública Geral GNU
+# junto com este programa. Se não, veja <https://www.gnu.org/licenses/>.
+
+import argparse
+import json
+import os
+import re
+
+from tempo import mongo_date_to_epoch_ms
+
+INDEX_VERSION = 1
+
+# Tamanho aproximado (em bytes) de cada bloco amostrado no índice
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+# Extrai o "$date" de uma linha sem decodificar o registro inteiro
+_DATE_PATTERN = re.compile(rb'"\$date"\s*:\s*"([^"]+)"')
+
+
+def index_path(input_file):
+    # O índice fica ao lado da exportação, com a extensão .idx
+    return input_file + ".idx"
+
+
+def _line_epoch_ms(line):
+    # Retorna o instante (ms UTC) de uma linha JSONL, ou None se não houver
+    match = _DATE_PATTERN.search(line)
+    try:
+        if match:
+            return mongo_date_to_epoch_ms(match.group(1).decode())
+        if line.strip():
+            return mongo_date_to_epoch_ms(json.loads(line)["datetime"]["$date"])
+    except (ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def build_index(input_file, block_size=DEFAULT_BLOCK_SIZE):
+    # Percorre a exportação uma vez, dividindo-a em blocos de ~block_size bytes
+    # alinhados ao início das linhas. Para cada bloco guarda o deslocamento
+    # inicial e os instantes mínimo e máximo dos registros, o que mantém as
+    # consultas corretas mesmo se a exportação não estiver ordenada.
+    stat = os.stat(input_file)
+    blocks = []
+    block_start = 0
+    block_min = block_max = None
+    offset = 0
+
+    with open(input_file, "rb") as f:
+        for line in f:
+            if offset - block_start >= block_size:
+                blocks.append([block_start, block_min, block_max])
+                block_start = offset
+                block_min = block_max = None
+
+            item_ms = _line_epoch_ms(line)
+            if item_ms is not None:
+                if block_min is None or item_ms < block_min:
+                    block_min = item_ms
+                if block_max is None or item_ms > block_max:
+                    block_max = item_ms
+            offset += len(line)
+
+    if offset > block_start:
+        blocks.append([block_start, block_min, block_max])
+
+    return {
+        "versao": INDEX_VERSION,
+        "tamanho": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "blocos": blocks,
+    }
+
+
+def _is_valid(index, input_file):
+    stat = os.stat(input_file)
+    return (
+        index.get("versao") == INDEX_VERSION
+        and index.get("tamanho") == stat.st_size
+        and index.get("mtime_ns") == stat.st_mtime_ns
+    )
+
+
+def load_index(input_file, block_size=DEFAULT_BLOCK_SIZE):
+    # Lê o índice salvo, reconstruindo-o se não existir ou se a exportação
+    # tiver mudado de tamanho ou data de modificação
+    path = index_path(input_file)
+    if os.path.exists(path):
+        try:
+            with open(path, "r") as f:
+                index = json.load(f)
+            if _is_valid(index, input_file):
+                return index
+        except (OSError, ValueError):
+            pass
+
+    print(f"Construindo índice: {path}")
+    index = build_index(input_file, block_size)
+
+    # Escreve em um arquivo temporário para não deixar um índice incompleto
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+    return index
+
+
+def window_ranges(index, start_ms, end_ms):
+    # Intervalos de bytes [início, fim) cujos blocos podem conter registros
+    # dentro da janela; blocos vizinhos são unidos em um único intervalo
+    blocks = index["blocos"]
+    ranges = []
+    for i, (block_start, block_min, block_max) in enumerate(blocks):
+        if block_min is None or block_max < start_ms or block_min > end_ms:
+            continue
+        block_end = blocks[i + 1][0] if i + 1 < len(blocks) else index["tamanho"]
+        if ranges and ranges[-1][1] == block_start:
+            ranges[-1][1] = block_end
+        else:
+            ranges.append([block_start, block_end])
+    return ranges
+
+
+def merge_ranges(ranges):
+    # Ordena e une intervalos de bytes sobrepostos ou adjacentes
+    merged = []
+    for range_start, range_end in sorted(ranges):
+        if merged and range_start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], range_end)
+        else:
+            merged.append([range_start, range_end])
+    return merged
+
+
+def read_ranges(input_file, ranges):
+    # Lê e decodifica apenas as linhas contidas nos intervalos de bytes
+    with open(input_file, "rb") as f:
+        for range_start, range_end in ranges:
+            f.seek(range_start)
+            offset = range_start
+            while offset < range_end:
+                line = f.readline()
+                if not line:
+                    break
+                offset += len(line)
+                if line.strip():
+                    yield json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Constrói o índice de tempo de uma exportação JSONL"
+    )
+    parser.add_argument(
+        "--simulacao", "-s", type=str, required=True, help="Número da simulação"
+    )
+    parser.add_argument(
+        "--telhado", "-t", type=str, required=True, help="Número do telhado"
+    )
+    parser.add_argument(
+        "--bloco",
+        type=int,
+        default=DEFAULT_BLOCK_SIZE,
+        help="Tamanho aproximado de cada bloco do índice em bytes",
+    )
+
+    args = parser.parse_args()
+
+    input_file = f"simulacao{args.simulacao}/telhado{args.telhado}/json/Telhado{args.telhado}.json"
+
+    index = load_index(input_file, args.bloco)
+    print(f"Índice com {len(index['blocos'])} blocos: {index_path(input_file)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# Tratamento de Dados - Um exemplo de projeto Python
+# Copyright (C) 2024 Vinicius Patriarca Miranda Miguel
+
+# Este programa é software livre: você pode redistribuí-lo e/ou modificá-lo
+# sob os termos da Licença Pública Geral GNU como publicada pela Free Software
+# Foundation, tanto a versão 3 da Licença, como (a seu critério) qualquer versão posterior.
+
+# Este programa é distribuído na esperança de que seja útil,
+# mas SEM NENHUMA GARANTIA; sem mesmo a garantia implícita de
+# COMERCIABILIDADE ou ADEQUAÇÃO A UM DETERMINADO FIM. Veja a
+# Licença Pública Geral GNU para mais detalhes.
+
+# Você deve ter recebido uma cópia da Licença Pública Geral GNU
+# junto com este programa. Se não, veja <https://www.gnu.org/licenses/>.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from serieBinaria import SERIES_EXTENSION, open_series
+
+# Sufixos dos nomes das séries. Os tópicos do firmware têm um prefixo (por
+# exemplo ic_escoamentoTelhado-1_NivelAgua(cm)), então as séries são
+# encontradas pelo fim do nome.
+NIVEL = "NivelAgua(cm)"
+NIVEL_CORRIGIDO = "NivelAguaCorrigido(cm)"
+VOLUME = "Volume(cm3)"
+RAIO_GALAO = "RaioGalao"
+
+
+def parse_time(column):
+    # Converte a coluna 'data' para datetime de forma vetorizada, aceitando os
+    # formatos gerados pelo criacsv: "H:MM" (legado, apenas hora e minuto),
+    # data e hora completas em ISO 8601 ou milissegundos desde a época
+    column = pd.Series(column)
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return column
+    if pd.api.types.is_numeric_dtype(column):
+        return pd.to_datetime(column, unit="ms")
+
+    column = column.astype(str)
+    if column.str.fullmatch(r"\d{1,2}:\d{2}").all():
+        return pd.to_datetime(column, format="%H:%M")
+    return pd.to_datetime(column, format="ISO8601")
+
+
+def series_with_suffix(series, sufixo):
+    # Nomes das séries que terminam em 'sufixo', em ordem alfabética e sem as
+    # saídas de escoamento
+    return sorted(
+        nome
+        for nome in series
+        if nome.endswith(sufixo) and not nome.startswith("Escoamento")
+    )
+
+
+def find_series(csv_dir, sufixo):
+    # Caminho do CSV de csv_dir cuja série termina em 'sufixo' (a última em
+    # ordem alfabética, se houver mais de uma), ou None
+    if not os.path.isdir(csv_dir):
+        return None
+    nomes = series_with_suffix(
+        [
+            os.path.splitext(arquivo)[0]
+            for arquivo in os.listdir(csv_dir)
+            if arquivo.endswith(".csv")
+        ],
+        sufixo,
+    )
+    return os.path.join(csv_dir, nomes[-1] + ".csv") if nomes else None
+
+
+def elapsed_hours(times):
+    # Horas decorridas desde o primeiro instante da série
+    return (times - times.min()).dt.total_seconds() / 3600
+
+
+def load_series(path):
+    # Carrega uma série como DataFrame com as colunas 'data' (datetime) e 'body'.
+    # Arquivos .serie são abertos com memmap, sem interpretação de texto.
+    if os.path.splitext(path)[1] == SERIES_EXTENSION:
+        timestamps_ms, values, _ = open_series(path)
+        return pd.DataFrame(
+            {
+                "data": np.asarray(timestamps_ms).astype("datetime64[ms]"),
+                "body": np.asarray(values),
+            }
+        )
+
+    df = pd.read_csv(path)
+    df["data"] = parse_time(df["data"])
+    return df
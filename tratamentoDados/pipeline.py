@@ -0,0 +1,383 @@
+# Tratamento de Dados - Um exemplo de projeto Python
+# Copyright (C) 2024 Vinicius Patriarca Miranda Miguel
+
+# Este programa é software livre: você pode redistribuí-lo e/ou modificá-lo
+# sob os termos da Licença Pública Geral GNU como publicada pela Free Software
+# Foundation, tanto a versão 3 da Licença, como (a seu critério) qualquer versão posterior.
+
+# Este programa é distribuído na esperança de que seja útil,
+# mas SEM NENHUMA GARANTIA; sem mesmo a garantia implícita de
+# COMERCIABILIDADE ou ADEQUAÇÃO A UM DETERMINADO FIM. Veja a
+# Licença Pública Geral GNU para mais detalhes.
+
+# Você deve ter recebido uma cópia da Licença Pública Geral GNU
+# junto com este programa. Se não, veja <https://www.gnu.org/licenses/>.
+
+import argparse
+import os
+import sys
+from graphlib import TopologicalSorter
+
+import matplotlib
+
+import calculaEscoamento
+import compressao
+import corrigeNivel
+import corrigeVolume
+import criacsv
+import filtroMonotono
+import graficoSimulacao
+import leituraSerie
+import renderizacao
+import separajson
+import tempo
+from cacheDependencias import DependencyCache, add_force_argument, code_version
+from calculaEscoamento import flow_frame, is_level_input, load_geometry
+from compressao import find_input
+from corrigeNivel import correct_level, sort_by_time
+from corrigeVolume import correct_volume
+from criacsv import items_to_csv, items_to_frame
+from filtroMonotono import PESOS
+from graficoSimulacao import plot_frame
+from leituraSerie import (
+    NIVEL,
+    NIVEL_CORRIGIDO,
+    RAIO_GALAO,
+    VOLUME,
+    series_with_suffix,
+)
+from renderizacao import add_decimation_arguments
+from separajson import group_by_topic, noronha_window, window_inputs, write_topics
+
+
+def topic_name(topic):
+    # Nome da série de um tópico, igual ao nome dos arquivos JSON e CSV
+    return topic.replace("/", "_").replace(" ", "_")
+
+
+def _missing(etapa, sufixo):
+    print(f"Aviso: etapa {etapa} sem série terminada em {sufixo}; nada a fazer")
+
+
+def _persist(contexto, nomes):
+    # Grava no diretório csv as séries indicadas, se solicitado
+    if not contexto["persistir"]:
+        return
+    os.makedirs(contexto["csv_dir"], exist_ok=True)
+    for nome in nomes:
+        output_file = os.path.join(contexto["csv_dir"], nome + ".csv")
+        contexto["series"][nome].to_csv(output_file, index=False, lineterminator="\n")
+        contexto["saidas"].append(output_file)
+        print(f"Arquivo CSV criado: {output_file}")
+
+
+def stage_separa(contexto):
+    # separajson: itens da janela agrupados por tópico
+    inicio, fim = noronha_window(*contexto["janela"])
+    contexto["itens"] = group_by_topic(
+        contexto["entrada"], inicio, fim, contexto["indice"]
+    )
+    if contexto["persistir"]:
+        contexto["saidas"].extend(
+            write_topics(contexto["itens"], contexto["json_dir"], contexto["compacto"])
+        )
+
+
+def stage_csv(contexto):
+    # criacsv: um DataFrame por tópico
+    contexto["series"] = {
+        topic_name(topic): items_to_frame(items, contexto["tempo"])
+        for topic, items in contexto["itens"].items()
+    }
+    if not contexto["persistir"]:
+        return
+
+    # Os CSVs são gravados a partir dos itens, com o body como veio no JSON,
+    # para ficarem idênticos aos do criacsv
+    os.makedirs(contexto["csv_dir"], exist_ok=True)
+    for topic, items in contexto["itens"].items():
+        output_file = os.path.join(contexto["csv_dir"], topic_name(topic) + ".csv")
+        items_to_csv(items, output_file, contexto["tempo"])
+        contexto["saidas"].append(output_file)
+        print(f"Arquivo CSV criado: {output_file}")
+
+
+def stage_corrige_nivel(contexto):
+    # corrigeNivel: <prefixo>NivelAgua(cm) -> <prefixo>NivelAguaCorrigido(cm)
+    series = contexto["series"]
+    nomes = series_with_suffix(series, NIVEL)
+    if not nomes:
+        _missing("corrigeNivel", NIVEL)
+    corrigidos = []
+    for nome in nomes:
+        corrigido = nome[: -len(NIVEL)] + NIVEL_CORRIGIDO
+        series[corrigido] = correct_level(
+            sort_by_time(series[nome]), **contexto["correcao"]
+        )
+        corrigidos.append(corrigido)
+    _persist(contexto, corrigidos)
+
+
+def stage_corrige_volume(contexto):
+    # corrigeVolume: corrige <prefixo>Volume(cm3) no lugar
+    series = contexto["series"]
+    nomes = series_with_suffix(series, VOLUME)
+    if not nomes:
+        _missing("corrigeVolume", VOLUME)
+    for nome in nomes:
+        series[nome] = correct_volume(series[nome], **contexto["correcao"])
+    _persist(contexto, nomes)
+
+
+def stage_escoamento(contexto):
+    # calculaEscoamento: EscoamentoPy_<nível> para cada série de nível
+    series = contexto["series"]
+    raios = series_with_suffix(series, RAIO_GALAO)
+    geometry = load_geometry(
+        contexto["simulacao"],
+        contexto["telhado"],
+        contexto["raio"],
+        series[raios[-1]] if raios else None,
+    )
+    niveis = [nome for nome in series if is_level_input(nome)]
+    if not niveis:
+        _missing("escoamento", NIVEL)
+    novos = []
+    for nome in niveis:
+        escoamento_df, descartados = flow_frame(
+            series[nome],
+            geometry["raio"],
+            geometry["unidade_volume"],
+            geometry["unidade_tempo"],
+        )
+        if descartados:
+            print(
+                f"{nome}: {descartados} intervalos de tempo nulos ou negativos descartados"
+            )
+        series[f"EscoamentoPy_{nome}"] = escoamento_df
+        novos.append(f"EscoamentoPy_{nome}")
+    _persist(contexto, novos)
+
+
+def stage_graficos(contexto):
+    # graficoSimulacao: um gráfico por série
+    os.makedirs(contexto["graficos_dir"], exist_ok=True)
+    for nome, df in sorted(contexto["series"].items()):
+        output_path = plot_frame(
+            df,
+            nome + ".csv",
+            contexto["graficos_dir"],
+            contexto["max_pontos"],
+            contexto["decimacao"],
+        )
+        if output_path is not None:
+            contexto["saidas"].append(output_path)
+            print(f"Gráfico salvo em {output_path}")
+
+
+# Etapas do pipeline e as etapas de que cada uma depende
+ETAPAS = {
+    "separa": (stage_separa, []),
+    "csv": (stage_csv, ["separa"]),
+    "corrigeNivel": (stage_corrige_nivel, ["csv"]),
+    "corrigeVolume": (stage_corrige_volume, ["csv"]),
+    "escoamento": (stage_escoamento, ["corrigeNivel"]),
+    "graficos": (stage_graficos, ["corrigeNivel", "corrigeVolume", "escoamento"]),
+}
+
+
+def pipeline_code_version():
+    # Versão do código de todas as etapas do pipeline
+    return code_version(
+        sys.modules[__name__],
+        calculaEscoamento,
+        compressao,
+        corrigeNivel,
+        corrigeVolume,
+        criacsv,
+        filtroMonotono,
+        graficoSimulacao,
+        leituraSerie,
+        renderizacao,
+        separajson,
+        tempo,
+    )
+
+
+def run_pipeline(contexto, etapas=None):
+    # Executa as etapas em uma ordem compatível com as dependências. Com
+    # 'etapas', executa apenas essas e as de que elas dependem. Os arquivos
+    # gravados pelas etapas são acumulados em contexto["saidas"].
+    contexto.setdefault("saidas", [])
+    grafo = {nome: set(dependencias) for nome, (_, dependencias) in ETAPAS.items()}
+    if etapas:
+        necessarias = set()
+        pendentes = list(etapas)
+        while pendentes:
+            nome = pendentes.pop()
+            if nome not in necessarias:
+                necessarias.add(nome)
+                pendentes.extend(grafo[nome])
+        grafo = {nome: grafo[nome] for nome in necessarias}
+
+    for nome in TopologicalSorter(grafo).static_order():
+        print(f"== {nome}")
+        ETAPAS[nome][0](contexto)
+    return contexto
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Executa toda a cadeia de tratamento de um telhado em um único processo"
+    )
+    parser.add_argument(
+        "--simulacao", "-s", type=str, required=True, help="Número da simulação"
+    )
+    parser.add_argument(
+        "--telhado", "-t", type=str, required=True, help="Número do telhado"
+    )
+    parser.add_argument(
+        "--inicio",
+        "-i",
+        type=str,
+        required=True,
+        help="Hora de início do intervalo (formato: HH:MM)",
+    )
+    parser.add_argument(
+        "--fim",
+        "-f",
+        type=str,
+        required=True,
+        help="Hora de fim do intervalo (formato: HH:MM)",
+    )
+    parser.add_argument(
+        "--dia-inicio",
+        type=str,
+        required=True,
+        help="Dia de início do intervalo (formato: YYYY-MM-DD)",
+    )
+    parser.add_argument(
+        "--dia-fim",
+        type=str,
+        required=True,
+        help="Dia de fim do intervalo (formato: YYYY-MM-DD)",
+    )
+    parser.add_argument(
+        "--indice",
+        action="store_true",
+        help="Usa (e cria, se preciso) o índice de tempo da exportação para ler só a janela",
+    )
+    parser.add_argument(
+        "--compacto",
+        action="store_true",
+        help="Com --persistir, escreve os arquivos JSON sem indentação",
+    )
+    parser.add_argument(
+        "--tempo",
+        choices=["hm", "completo"],
+        default="hm",
+        help="Formato da coluna 'data': H:MM (padrão) ou data e hora completas com milissegundos",
+    )
+    parser.add_argument(
+        "--tolerancia",
+        type=float,
+        default=0.0,
+        help="Tolerância das correções de nível e volume",
+    )
+    parser.add_argument(
+        "--histerese",
+        type=float,
+        default=0.0,
+        help="Histerese das correções de nível e volume",
+    )
+    parser.add_argument(
+        "--modo",
+        choices=["filtro", "isotonic"],
+        default="filtro",
+        help="Modo das correções de nível e volume",
+    )
+    parser.add_argument(
+        "--pesos",
+        choices=PESOS,
+        default="uniforme",
+        help="Pesos da regressão isotônica das correções de nível e volume",
+    )
+    parser.add_argument(
+        "--raio",
+        type=float,
+        help="Raio do galão em cm (padrão: tanque.json, tópico RaioGalao ou 30)",
+    )
+    parser.add_argument(
+        "--etapas",
+        nargs="+",
+        choices=list(ETAPAS),
+        help="Executa apenas estas etapas (e as de que dependem)",
+    )
+    parser.add_argument(
+        "--persistir",
+        action="store_true",
+        help="Grava os resultados intermediários (JSON e CSV por tópico), como os scripts separados",
+    )
+    add_force_argument(
+        parser, "Executa o pipeline mesmo que as saídas já estejam atualizadas"
+    )
+    add_decimation_arguments(parser)
+
+    args = parser.parse_args()
+
+    base_dir = f"simulacao{args.simulacao}/telhado{args.telhado}"
+    contexto = {
+        "entrada": find_input(f"{base_dir}/json/Telhado{args.telhado}.json"),
+        "janela": (args.dia_inicio, args.inicio, args.dia_fim, args.fim),
+        "indice": args.indice,
+        "tempo": args.tempo,
+        "compacto": args.compacto,
+        "correcao": {
+            "tolerancia": args.tolerancia,
+            "histerese": args.histerese,
+            "modo": args.modo,
+            "pesos": args.pesos,
+        },
+        "simulacao": args.simulacao,
+        "telhado": args.telhado,
+        "raio": args.raio,
+        "persistir": args.persistir,
+        "json_dir": f"{base_dir}/json",
+        "csv_dir": f"{base_dir}/csv",
+        "graficos_dir": f"{base_dir}/graficos",
+        "max_pontos": args.max_pontos,
+        "decimacao": args.decimacao,
+    }
+
+    # Pula a execução se o trecho da exportação, o tanque.json, as opções e o
+    # código não mudaram desde a última execução com as mesmas etapas
+    cache = DependencyCache.from_args(base_dir, args)
+    chave = "pipeline:" + ",".join(sorted(args.etapas or ETAPAS))
+    tanque_json = f"{base_dir}/tanque.json"
+    entradas = cache.input_hashes(
+        window_inputs(
+            contexto["entrada"], *noronha_window(*contexto["janela"]), args.indice
+        )
+    )
+    if os.path.isfile(tanque_json):
+        entradas.update(cache.input_hashes([tanque_json]))
+    parametros = {
+        nome: valor
+        for nome, valor in contexto.items()
+        if nome not in ("entrada", "indice")
+    }
+    parametros["etapas"] = sorted(args.etapas or ETAPAS)
+    parametros["tanque"] = os.path.isfile(tanque_json)
+    parametros["matplotlib"] = matplotlib.__version__
+    codigo = pipeline_code_version()
+    if cache.is_up_to_date(chave, entradas, parametros, codigo):
+        print(f"Saídas atualizadas, nada a executar: {base_dir}")
+        return
+
+    run_pipeline(contexto, args.etapas)
+    cache.record(chave, entradas, parametros, codigo, contexto["saidas"])
+    cache.save()
+
+
+if __name__ == "__main__":
+    main()
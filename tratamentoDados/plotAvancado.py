@@ -15,14 +15,37 @@
 
 import argparse
 import os
+import sys
 
-import matplotlib.pyplot as plt
+import matplotlib
 import numpy as np
 import pandas as pd
 
+import ajusteCurvas
+import leituraSerie
+import renderizacao
+from ajusteCurvas import (
+    GRAU_PADRAO,
+    NOS_PADRAO,
+    TIPOS,
+    evaluate_fit,
+    fit_series,
+    fit_simulation,
+)
+from cacheDependencias import DependencyCache, add_force_argument, code_version
+from leituraSerie import parse_time
+from renderizacao import MAX_PONTOS_PADRAO, add_decimation_arguments, template
+
 
 def process_csv(
-    simulacao, telhado, file_name, curves_output_dir, derivatives_output_dir
+    simulacao,
+    telhado,
+    file_name,
+    curves_output_dir,
+    derivatives_output_dir,
+    max_pontos=MAX_PONTOS_PADRAO,
+    decimacao="lttb",
+    ajuste=None,
 ):
     # Constrói o caminho completo do arquivo de entrada
     input_file = f"simulacao{simulacao}/telhado{telhado}/csv/{file_name}"
@@ -35,8 +58,8 @@ def process_csv(
         print(f"O arquivo {input_file} deve ter pelo menos duas colunas.")
         return
 
-    # Converte a coluna de data para datetime, considerando apenas hora e minuto
-    data["Hora_Minuto"] = pd.to_datetime(data["data"], format="%H:%M")
+    # Converte a coluna de data para datetime (H:MM ou data e hora completas)
+    data["Hora_Minuto"] = parse_time(data["data"])
 
     # Ajusta o primeiro tempo para ser 0
     min_time = data["Hora_Minuto"].min()
@@ -58,23 +81,15 @@ def process_csv(
     times = data["Hora_Minuto"].values
     values = data[value_column_name].values
 
-    # Fit a polynomial to the data
-    degree = 5
-    coeffs = np.polyfit(times, values, degree)
-    poly = np.poly1d(coeffs)
-
-    # Compute the derivative of the polynomial
-    derivative = np.polyder(poly)
+    # Usa o ajuste salvo pelo ajusteCurvas ou, sem ele, ajusta um polinômio
+    # de grau 5 apenas a esta série
+    if ajuste is None:
+        ajuste = fit_series([(times, values)])[0]
 
     # Generate points for plotting the fitted curve and its derivative
     times_fit = np.linspace(min(times), max(times), 500)
-    values_fit = poly(times_fit)
-    derivative_fit = derivative(times_fit)
-
-    # Plot the data and the fitted curve
-    plt.figure(figsize=(20, 5))
-    plt.plot(times, values, "bo", label="Original Data")
-    plt.plot(times_fit, values_fit, "r-", label="Fitted Curve")
+    values_fit = evaluate_fit(ajuste, times_fit)
+    derivative_fit = evaluate_fit(ajuste, times_fit, derivada=True)
 
     # Define os rótulos do eixo x como HH:MM a cada 10 minutos
     max_time = data["Hora_Minuto"].max()
@@ -82,45 +97,31 @@ def process_csv(
         print(f"Não foi possível determinar o máximo tempo válido em {file_name}.")
         return
 
-    max_time_minutes = max_time * 60  # Converte para minutos
-    interval = 10  # Intervalo de 10 minutos para os ticks
-    ticks = range(
-        0, int(max_time_minutes) + interval, interval
-    )  # Cria ticks a cada 10 minutos
-    x_labels = [f"{tick//60:02d}:{tick%60:02d}" for tick in ticks]
-    ticks_hours = [
-        tick / 60 for tick in ticks
-    ]  # Converte ticks de volta para horas decimais
-
-    plt.xticks(ticks=ticks_hours, labels=x_labels, rotation=45)
-
-    plt.xlabel("Time (minutes since start)")
-    plt.ylabel("Water Level (cm)")
-    plt.legend()
-    plt.title("Water Level and Fitted Curve")
-    plt.grid(True)
-    fitted_curve_output_path = os.path.join(
-        curves_output_dir, file_name.replace(".csv", "_fitted_curve.png")
+    # Plot the data and the fitted curve
+    fitted_curve_output_path = template("curva", [("bo", {}), ("r-", {})]).render(
+        os.path.join(curves_output_dir, file_name.replace(".csv", "_fitted_curve.png")),
+        [(times, values), (times_fit, values_fit)],
+        max_time,
+        "Time (minutes since start)",
+        "Water Level (cm)",
+        "Water Level and Fitted Curve",
+        labels=["Original Data", "Fitted Curve"],
+        max_pontos=max_pontos,
+        decimacao=decimacao,
     )
-    plt.savefig(fitted_curve_output_path)
-    plt.close()
 
     # Plot the derivative
-    plt.figure(figsize=(20, 5))
-    plt.plot(times_fit, derivative_fit, "g--", label="Derivative")
-    plt.xticks(
-        ticks=ticks_hours, labels=x_labels, rotation=45
-    )  # Adiciona os rótulos ao gráfico da derivada
-    plt.xlabel("Time (minutes since start)")
-    plt.ylabel("Derivative of Water Level (cm/min)")
-    plt.legend()
-    plt.title("Derivative of Water Level")
-    plt.grid(True)
-    derivative_output_path = os.path.join(
-        derivatives_output_dir, file_name.replace(".csv", "_derivative.png")
+    derivative_output_path = template("derivada", [("g--", {})]).render(
+        os.path.join(
+            derivatives_output_dir, file_name.replace(".csv", "_derivative.png")
+        ),
+        [(times_fit, derivative_fit)],
+        max_time,
+        "Time (minutes since start)",
+        "Derivative of Water Level (cm/min)",
+        "Derivative of Water Level",
+        labels=["Derivative"],
     )
-    plt.savefig(derivative_output_path)
-    plt.close()
 
     return fitted_curve_output_path, derivative_output_path
 
@@ -136,6 +137,23 @@ def main():
         "--telhado", "-t", type=str, required=True, help="Número do telhado"
     )
 
+    parser.add_argument(
+        "--tipo", choices=TIPOS, default="polinomio", help="Tipo de ajuste"
+    )
+    parser.add_argument(
+        "--grau", type=int, default=GRAU_PADRAO, help="Grau do polinômio"
+    )
+    parser.add_argument(
+        "--nos",
+        type=int,
+        default=NOS_PADRAO,
+        help="Número de nós internos da spline",
+    )
+    add_force_argument(
+        parser, "Refaz os ajustes e os gráficos mesmo se já estiverem atualizados"
+    )
+    add_decimation_arguments(parser)
+
     args = parser.parse_args()
 
     input_dir = f"simulacao{args.simulacao}/telhado{args.telhado}/csv/"
@@ -149,17 +167,56 @@ def main():
     os.makedirs(curves_output_dir, exist_ok=True)
     os.makedirs(derivatives_output_dir, exist_ok=True)
 
-    # Processa todos os arquivos CSV na pasta de entrada
-    for file_name in os.listdir(input_dir):
-        if file_name.endswith(".csv"):
-            outputs = process_csv(
-                args.simulacao,
-                args.telhado,
-                file_name,
-                curves_output_dir,
-                derivatives_output_dir,
+    # Gráficos cujo CSV, ajuste, opções e código não mudaram não são gerados
+    # de novo
+    cache = DependencyCache.from_args(base_output_dir, args)
+    parametros = {
+        "tipo": args.tipo,
+        "grau": args.grau,
+        "nos": args.nos,
+        "max_pontos": args.max_pontos,
+        "decimacao": args.decimacao,
+        "matplotlib": matplotlib.__version__,
+    }
+    codigo = code_version(
+        sys.modules[__name__], ajusteCurvas, renderizacao, leituraSerie
+    )
+    pendentes = [
+        file_name
+        for file_name in sorted(os.listdir(input_dir))
+        if file_name.endswith(".csv")
+        and not cache.is_up_to_date(
+            file_name, [input_dir + file_name], parametros, codigo
+        )
+    ]
+    if not pendentes:
+        print(f"Gráficos atualizados: {base_output_dir}")
+        return
+
+    # Ajusta de uma vez as séries sem ajuste salvo e reutiliza as demais
+    ajustes = fit_simulation(
+        args.simulacao, args.telhado, args.tipo, args.grau, args.nos, args.forcar
+    )
+
+    # Processa os arquivos CSV da pasta de entrada com gráficos desatualizados
+    for file_name in pendentes:
+        outputs = process_csv(
+            args.simulacao,
+            args.telhado,
+            file_name,
+            curves_output_dir,
+            derivatives_output_dir,
+            args.max_pontos,
+            args.decimacao,
+            ajustes.get(f"telhado{args.telhado}/{file_name}"),
+        )
+        if outputs is not None:
+            cache.record(
+                file_name, [input_dir + file_name], parametros, codigo, outputs
             )
-            print(f"Gráficos salvos em {outputs}")
+        print(f"Gráficos salvos em {outputs}")
+
+    cache.save()
 
 
 if __name__ == "__main__":
@@ -14,116 +14,163 @@
 # junto com este programa. Se não, veja <https://www.gnu.org/licenses/>.
 
 import argparse
+import itertools
 import os
+import sys
 
-import matplotlib.pyplot as plt
+import matplotlib
 import pandas as pd
 
+import leituraSerie
+import renderizacao
+from cacheDependencias import DependencyCache, add_force_argument, code_version
+from leituraSerie import parse_time
+from renderizacao import MAX_PONTOS_PADRAO, add_decimation_arguments, template
 
-def plot_combined_csv(simulacao, telhado1, telhado2, file_name, output_dir):
-    # Constrói o caminho completo dos arquivos de entrada de ambos telhados
-    input_file1 = f"simulacao{simulacao}/{telhado1}/csv/{file_name}"
-    input_file2 = f"simulacao{simulacao}/{telhado2}/csv/{file_name}"
 
-    # Verifica se ambos os arquivos existem
-    if not os.path.isfile(input_file1):
-        print(f"Arquivo {input_file1} não encontrado.")
-        return
-    if not os.path.isfile(input_file2):
-        print(f"Arquivo {input_file2} não encontrado.")
-        return
-
-    # Lê os arquivos CSV de ambos os telhados
-    data1 = pd.read_csv(input_file1)
-    data2 = pd.read_csv(input_file2)
+def load_frame(input_file):
+    # Lê e normaliza um CSV uma única vez: horas desde o início na coluna
+    # 'Hora_Minuto' e valores numéricos, sem linhas inválidas, em ordem de tempo.
+    # Retorna None se o arquivo não tiver as colunas esperadas.
+    data = pd.read_csv(input_file)
 
-    # Verifica se há pelo menos duas colunas em ambos os dataframes
-    if data1.shape[1] < 2 or data2.shape[1] < 2:
-        print(
-            f"Os arquivos {input_file1} e {input_file2} devem ter pelo menos duas colunas."
-        )
-        return
+    # Verifica se há pelo menos duas colunas
+    if data.shape[1] < 2:
+        print(f"O arquivo {input_file} deve ter pelo menos duas colunas.")
+        return None
 
-    # Converte a coluna de data para datetime, considerando apenas hora e minuto, para ambos os dataframes
-    data1["Hora_Minuto"] = pd.to_datetime(data1["data"], format="%H:%M")
-    data2["Hora_Minuto"] = pd.to_datetime(data2["data"], format="%H:%M")
+    # Converte a coluna de data para datetime (H:MM ou data e hora completas) e
+    # ajusta o primeiro tempo para ser 0
+    data["Hora_Minuto"] = parse_time(data["data"])
+    min_time = data["Hora_Minuto"].min()
+    data["Hora_Minuto"] = (data["Hora_Minuto"] - min_time).dt.total_seconds() / 3600
 
-    # Ajusta o primeiro tempo para ser 0, para ambos os dataframes
-    min_time1 = data1["Hora_Minuto"].min()
-    data1["Hora_Minuto"] = (data1["Hora_Minuto"] - min_time1).dt.total_seconds() / 3600
+    # A segunda coluna será a coluna de valores
+    value_column_name = data.columns[1]
+    data[value_column_name] = pd.to_numeric(data[value_column_name], errors="coerce")
 
-    min_time2 = data2["Hora_Minuto"].min()
-    data2["Hora_Minuto"] = (data2["Hora_Minuto"] - min_time2).dt.total_seconds() / 3600
+    # Remove linhas com valores inválidos e ordena pelo tempo
+    data.dropna(subset=[value_column_name], inplace=True)
+    data.sort_values(by="Hora_Minuto", inplace=True)
 
-    # A segunda coluna será a coluna de valores, para ambos os dataframes
-    value_column_name1 = data1.columns[1]
-    data1[value_column_name1] = pd.to_numeric(
-        data1[value_column_name1], errors="coerce"
+    return pd.DataFrame(
+        {"Hora_Minuto": data["Hora_Minuto"], "valor": data[value_column_name]}
     )
 
-    value_column_name2 = data2.columns[1]
-    data2[value_column_name2] = pd.to_numeric(
-        data2[value_column_name2], errors="coerce"
+
+def csv_files(simulacao, telhado):
+    # Nomes dos CSVs de um telhado, sem lê-los
+    csv_dir = f"simulacao{simulacao}/{telhado}/csv"
+    return sorted(
+        file_name for file_name in os.listdir(csv_dir) if file_name.endswith(".csv")
     )
 
-    # Remove linhas com valores inválidos na segunda coluna, para ambos os dataframes
-    data1.dropna(subset=[value_column_name1], inplace=True)
-    data2.dropna(subset=[value_column_name2], inplace=True)
 
-    # Ordena os dados pela coluna 'Hora_Minuto', para ambos os dataframes
-    data1.sort_values(by="Hora_Minuto", inplace=True)
-    data2.sort_values(by="Hora_Minuto", inplace=True)
+def has_values(input_file):
+    # Verifica, lendo apenas o cabeçalho, se o CSV tem a coluna de valores que
+    # load_frame exige
+    return pd.read_csv(input_file, nrows=0).shape[1] >= 2
+
+
+def load_frames(simulacao, telhados, arquivos=None):
+    # Carrega os CSVs de cada telhado uma única vez, como
+    # {telhado: {arquivo: DataFrame}}. Com 'arquivos' ({telhado: nomes}), lê
+    # apenas esses arquivos.
+    frames = {}
+    for telhado in telhados:
+        csv_dir = f"simulacao{simulacao}/{telhado}/csv"
+        frames[telhado] = {}
+        for file_name in csv_files(simulacao, telhado):
+            if arquivos is None or file_name in arquivos.get(telhado, ()):
+                frame = load_frame(os.path.join(csv_dir, file_name))
+                if frame is not None:
+                    frames[telhado][file_name] = frame
+    return frames
+
+
+def plot_roofs_csv(
+    simulacao,
+    telhados,
+    file_name,
+    output_path,
+    frames=None,
+    max_pontos=MAX_PONTOS_PADRAO,
+    decimacao="lttb",
+):
+    # Sobrepõe em uma figura a série 'file_name' de cada telhado. Sem 'frames',
+    # os CSVs são lidos do disco.
+    if frames is None:
+        frames = {}
+        for telhado in telhados:
+            input_file = f"simulacao{simulacao}/{telhado}/csv/{file_name}"
+
+            # Verifica se o arquivo existe
+            if not os.path.isfile(input_file):
+                print(f"Arquivo {input_file} não encontrado.")
+                return
+            frames[telhado] = {file_name: load_frame(input_file)}
+
+    data = [frames[telhado].get(file_name) for telhado in telhados]
+    if any(frame is None for frame in data):
+        return
 
     # Extrai o nome do arquivo para usar como rótulo do eixo y
     y_label = os.path.splitext(file_name)[0]  # Remove a extensão .csv
 
-    # Plota os dados combinados
-    plt.figure(figsize=(20, 5))
-    plt.plot(
-        data1["Hora_Minuto"],
-        data1[value_column_name1],
-        marker="o",
-        label=f"Telhado {telhado1}",
+    # Define os rótulos do eixo x como HH:MM a cada 10 minutos
+    max_time = max(frame["Hora_Minuto"].max() for frame in data)
+
+    # Plota os dados combinados no template compartilhado (um por número de
+    # telhados)
+    return template(
+        f"comparativo{len(telhados)}",
+        [(None, {"marker": "o"})] * len(telhados),
+        tight_layout=True,
+    ).render(
+        output_path,
+        [(frame["Hora_Minuto"], frame["valor"]) for frame in data],
+        max_time,
+        "Tempo (Horas:Minutos)",
+        y_label,  # Usa o nome do arquivo como rótulo do eixo y
+        f"Gráfico de Hora vs {y_label}",
+        labels=[f"Telhado {telhado}" for telhado in telhados],
+        max_pontos=max_pontos,
+        decimacao=decimacao,
     )
-    plt.plot(
-        data2["Hora_Minuto"],
-        data2[value_column_name2],
-        marker="o",
-        label=f"Telhado {telhado2}",
+
+
+def pair_output_path(output_dir, file_name, telhado1, telhado2):
+    # Nome único do gráfico de um par de telhados
+    stem = os.path.splitext(file_name)[0]
+    return os.path.join(output_dir, f"{stem}_{telhado1}_{telhado2}.png")
+
+
+def plot_combined_csv(
+    simulacao,
+    telhado1,
+    telhado2,
+    file_name,
+    output_dir,
+    frames=None,
+    max_pontos=MAX_PONTOS_PADRAO,
+    decimacao="lttb",
+):
+    # Gráfico da série 'file_name' de dois telhados
+    return plot_roofs_csv(
+        simulacao,
+        [telhado1, telhado2],
+        file_name,
+        pair_output_path(output_dir, file_name, telhado1, telhado2),
+        frames,
+        max_pontos,
+        decimacao,
     )
 
-    # Define os rótulos do eixo x como HH:MM a cada 10 minutos
-    max_time = max(data1["Hora_Minuto"].max(), data2["Hora_Minuto"].max())
-    max_time_minutes = max_time * 60  # Converte para minutos
-    interval = 10  # Intervalo de 10 minutos para os ticks
-    ticks = range(
-        0, int(max_time_minutes) + interval, interval
-    )  # Cria ticks a cada 10 minutos
-    x_labels = [f"{tick//60:02d}:{tick%60:02d}" for tick in ticks]
-    ticks_hours = [
-        tick / 60 for tick in ticks
-    ]  # Converte ticks de volta para horas decimais
-
-    plt.xticks(ticks=ticks_hours, labels=x_labels, rotation=45)
-
-    plt.xlabel("Tempo (Horas:Minutos)")
-    plt.ylabel(y_label)  # Usa o nome do arquivo como rótulo do eixo y
-    plt.title(f"Gráfico de Hora vs {y_label}")
-    plt.grid(True)
-    plt.legend()
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-
-    # Ajusta a distância entre as marcações no eixo x
-    ax = plt.gca()
-    ax.set_xticks(ticks_hours)
-
-    # Salva o gráfico no caminho de saída
-    output_path = os.path.join(output_dir, file_name.replace(".csv", ".png"))
-    plt.savefig(output_path)
-    plt.close()
-
-    return output_path
+
+def roof_key(telhado):
+    # Ordena os telhados pelo número (telhado2 antes de telhado10)
+    numero = telhado[len("telhado") :]
+    return (0, int(numero), "") if numero.isdigit() else (1, 0, numero)
 
 
 def main():
@@ -133,6 +180,16 @@ def main():
     parser.add_argument(
         "--simulacao", "-s", type=str, required=True, help="Número da simulação"
     )
+    parser.add_argument(
+        "--sobrepor",
+        action="store_true",
+        help="Gera um único gráfico por tópico com todos os telhados, em vez de um por par",
+    )
+    add_force_argument(
+        parser, "Gera todos os gráficos, mesmo os que já estão atualizados"
+    )
+
+    add_decimation_arguments(parser)
 
     args = parser.parse_args()
 
@@ -143,23 +200,97 @@ def main():
     os.makedirs(output_dir, exist_ok=True)
 
     telhados = os.listdir(simulacao_dir)
-    telhados = [telhado for telhado in telhados if telhado.startswith("telhado")]
-
-    # Processa todos os arquivos CSV em cada telhado
-    for telhado1 in telhados:
-        for telhado2 in telhados:
-            if telhado1 != telhado2:
-                csv_dir1 = os.path.join(simulacao_dir, telhado1, "csv")
-                csv_dir2 = os.path.join(simulacao_dir, telhado2, "csv")
-
-                for file_name in os.listdir(csv_dir1):
-                    if file_name.endswith(".csv"):
-                        plot_combined_csv(
-                            args.simulacao, telhado1, telhado2, file_name, output_dir
-                        )
-                        print(
-                            f'Gráfico combinado salvo em {output_dir}/{file_name.replace(".csv", ".png")} entre {telhado1} e {telhado2}'
-                        )
+    telhados = sorted(
+        (telhado for telhado in telhados if telhado.startswith("telhado")),
+        key=roof_key,
+    )
+
+    # CSVs de cada telhado que podem ser plotados; os que não têm a coluna de
+    # valores ficam de fora já aqui, para que o registro de dependências de
+    # cada gráfico cite exatamente os arquivos plotados
+    listagens = {}
+    for telhado in telhados:
+        listagens[telhado] = []
+        for file_name in csv_files(args.simulacao, telhado):
+            input_file = f"{simulacao_dir}/{telhado}/csv/{file_name}"
+            if has_values(input_file):
+                listagens[telhado].append(file_name)
+            else:
+                print(f"O arquivo {input_file} deve ter pelo menos duas colunas.")
+
+    # Gráficos a gerar, como (telhados, arquivo, saída)
+    if args.sobrepor:
+        # Um gráfico por tópico com todos os telhados que o possuem
+        graficos = []
+        for file_name in sorted(set().union(*listagens.values())):
+            presentes = [t for t in telhados if file_name in listagens[t]]
+            if len(presentes) >= 2:
+                output_path = os.path.join(
+                    output_dir, file_name.replace(".csv", ".png")
+                )
+                graficos.append((presentes, file_name, output_path))
+    else:
+        # Um gráfico por par de telhados (sem repetir o par invertido) e tópico
+        graficos = [
+            (
+                [telhado1, telhado2],
+                file_name,
+                pair_output_path(output_dir, file_name, telhado1, telhado2),
+            )
+            for telhado1, telhado2 in itertools.combinations(telhados, 2)
+            for file_name in listagens[telhado1]
+            if file_name in listagens[telhado2]
+        ]
+
+    # Gráficos cujos CSVs, opções e código não mudaram não são gerados de novo
+    cache = DependencyCache.from_args(output_dir, args)
+    parametros = {
+        "max_pontos": args.max_pontos,
+        "decimacao": args.decimacao,
+        "matplotlib": matplotlib.__version__,
+    }
+    codigo = code_version(sys.modules[__name__], renderizacao, leituraSerie)
+    pendentes = []
+    for presentes, file_name, output_path in graficos:
+        entradas = [f"{simulacao_dir}/{t}/csv/{file_name}" for t in presentes]
+        if not cache.is_up_to_date(
+            os.path.basename(output_path), entradas, parametros, codigo
+        ):
+            pendentes.append((presentes, file_name, output_path, entradas))
+    print(f"Gráficos a gerar: {len(pendentes)} de {len(graficos)}")
+
+    # Lê uma única vez apenas os CSVs usados pelos gráficos desatualizados
+    arquivos = {}
+    for presentes, file_name, _, _ in pendentes:
+        for telhado in presentes:
+            arquivos.setdefault(telhado, set()).add(file_name)
+    frames = load_frames(args.simulacao, list(arquivos), arquivos)
+
+    for presentes, file_name, output_path, entradas in pendentes:
+        output_path = plot_roofs_csv(
+            args.simulacao,
+            presentes,
+            file_name,
+            output_path,
+            frames,
+            args.max_pontos,
+            args.decimacao,
+        )
+        if output_path is None:
+            continue
+        cache.record(
+            os.path.basename(output_path), entradas, parametros, codigo, [output_path]
+        )
+        if args.sobrepor:
+            print(
+                f"Gráfico combinado salvo em {output_path} com {', '.join(presentes)}"
+            )
+        else:
+            print(
+                f"Gráfico combinado salvo em {output_path} entre {presentes[0]} e {presentes[1]}"
+            )
+
+    cache.save()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,185 @@
+# Tratamento de Dados - Um exemplo de projeto Python
+# Copyright (C) 2024 Vinicius Patriarca Miranda Miguel
+
+# Este programa é software livre: você pode redistribuí-lo e/ou modificá-lo
+# sob os termos da Licença Pública Geral GNU como publicada pela Free Software
+# Foundation, tanto a versão 3 da Licença, como (a seu critério) qualquer versão posterior.
+
+# Este programa é distribuído na esperança de que seja útil,
+# mas SEM NENHUMA GARANTIA; sem mesmo a garantia implícita de
+# COMERCIABILIDADE ou ADEQUAÇÃO A UM DETERMINADO FIM. Veja a
+# Licença Pública Geral GNU para mais detalhes.
+
+# Você deve ter recebido uma cópia da Licença Pública Geral GNU
+# junto com este programa. Se não, veja <https://www.gnu.org/licenses/>.
+
+import numpy as np
+from matplotlib.figure import Figure
+
+# Tamanho padrão das figuras dos gráficos de séries temporais
+TAMANHO_FIGURA = (20, 5)
+
+# Acima deste número de pontos as séries são reduzidas antes de desenhar (a
+# figura padrão tem 2000 pixels de largura)
+MAX_PONTOS_PADRAO = 5000
+DECIMACOES = ("lttb", "minmax")
+
+# Figuras já montadas, por layout, reaproveitadas entre os gráficos do mesmo
+# processo
+_TEMPLATES = {}
+
+
+def time_ticks(max_time, interval=10):
+    # Posições (em horas) e rótulos HH:MM das marcações do eixo x, a cada
+    # 'interval' minutos de 0 até max_time (em horas)
+    max_time_minutes = max_time * 60  # Converte para minutos
+    ticks = range(0, int(max_time_minutes) + interval, interval)
+    x_labels = [f"{tick//60:02d}:{tick%60:02d}" for tick in ticks]
+    ticks_hours = [tick / 60 for tick in ticks]
+    return ticks_hours, x_labels
+
+
+def lttb(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: mantém o primeiro e o último ponto e, em
+    # cada um dos n_out - 2 grupos intermediários, o ponto que forma o maior
+    # triângulo com o ponto escolhido no grupo anterior e a média do grupo
+    # seguinte. 'x' deve estar em ordem crescente.
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+
+    # Limites dos grupos e médias de cada grupo (e do último ponto), de uma vez
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    counts = np.diff(np.r_[edges, n])
+    mean_x = np.add.reduceat(x, edges) / counts
+    mean_y = np.add.reduceat(y, edges) / counts
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        s, e = edges[i], edges[i + 1]
+        area = np.abs(
+            (x[a] - mean_x[i + 1]) * (y[s:e] - y[a])
+            - (x[a] - x[s:e]) * (mean_y[i + 1] - y[a])
+        )
+        a = s + int(np.argmax(area))
+        selected[i + 1] = a
+    return x[selected], y[selected]
+
+
+def minmax_buckets(x, y, n_out):
+    # Divide a série em n_out / 2 grupos de tamanho igual e mantém o mínimo e o
+    # máximo de cada um, na ordem original, preservando os picos
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    buckets = n_out // 2
+    if n_out >= n or buckets < 1:
+        return x, y
+
+    bucket = np.arange(n) * buckets // n
+    order = np.lexsort((y, bucket))
+    starts = np.searchsorted(bucket[order], np.arange(buckets))
+    ends = np.r_[starts[1:], n] - 1
+    selected = np.unique(np.r_[order[starts], order[ends]])
+    return x[selected], y[selected]
+
+
+def decimate(x, y, max_pontos=MAX_PONTOS_PADRAO, metodo="lttb"):
+    # Reduz a série para no máximo max_pontos pontos (0 ou None desativa)
+    if not max_pontos or len(x) <= max_pontos:
+        return x, y
+    if metodo == "minmax":
+        return minmax_buckets(x, y, max_pontos)
+    if metodo == "lttb":
+        return lttb(x, y, max_pontos)
+    raise ValueError(f"Decimação desconhecida: {metodo}")
+
+
+class FigureTemplate:
+    """Figura montada uma única vez e reaproveitada para vários gráficos.
+
+    Cria a figura, os eixos e uma linha por estilo apenas na construção; cada
+    chamada de render troca os dados das linhas, os rótulos e as marcações do
+    eixo x e salva a imagem. O resultado é o mesmo de montar a figura do zero,
+    sem o custo de criá-la a cada arquivo.
+    """
+
+    def __init__(self, estilos, figsize=TAMANHO_FIGURA, tight_layout=False):
+        # estilos: lista de (formato, propriedades) de cada linha, como nos
+        # argumentos de Axes.plot, por exemplo ("bo", {}) ou (None, {"marker": "o"})
+        self.figure = Figure(figsize=figsize)
+        self.ax = self.figure.subplots()
+        self.lines = [
+            self.ax.plot([], [], *([fmt] if fmt else []), **props)[0]
+            for fmt, props in estilos
+        ]
+        self.ax.grid(True)
+        self.tight_layout = tight_layout
+        self._subplotpars = vars(self.figure.subplotpars).copy()
+
+    def render(
+        self,
+        output_path,
+        series,
+        max_time,
+        xlabel,
+        ylabel,
+        title,
+        labels=None,
+        max_pontos=MAX_PONTOS_PADRAO,
+        decimacao="lttb",
+    ):
+        # series: um par (x, y) por linha do template. Com labels, a legenda é
+        # refeita com os novos rótulos das linhas. Séries com mais de
+        # max_pontos pontos são reduzidas antes de desenhar.
+        for line, (x, y) in zip(self.lines, series):
+            line.set_data(*decimate(x, y, max_pontos, decimacao))
+        self.ax.relim()
+        self.ax.autoscale_view()
+
+        ticks_hours, x_labels = time_ticks(max_time)
+        self.ax.set_xticks(ticks_hours, labels=x_labels, rotation=45)
+
+        self.ax.set_xlabel(xlabel)
+        self.ax.set_ylabel(ylabel)
+        self.ax.set_title(title)
+
+        if labels is not None:
+            for line, label in zip(self.lines, labels):
+                line.set_label(label)
+            self.ax.legend()
+
+        if self.tight_layout:
+            # Parte sempre das margens originais, como uma figura nova
+            self.figure.subplots_adjust(**self._subplotpars)
+            self.figure.tight_layout()
+
+        self.figure.savefig(output_path)
+        return output_path
+
+
+def add_decimation_arguments(parser):
+    # Opções de redução de pontos comuns aos scripts de gráficos
+    parser.add_argument(
+        "--max-pontos",
+        type=int,
+        default=MAX_PONTOS_PADRAO,
+        help="Número máximo de pontos desenhados por série (0 desativa a redução)",
+    )
+    parser.add_argument(
+        "--decimacao",
+        choices=DECIMACOES,
+        default="lttb",
+        help="Método de redução de pontos das séries longas",
+    )
+
+
+def template(nome, estilos, figsize=TAMANHO_FIGURA, tight_layout=False):
+    # Template do layout 'nome', criado no primeiro uso
+    if nome not in _TEMPLATES:
+        _TEMPLATES[nome] = FigureTemplate(estilos, figsize, tight_layout)
+    return _TEMPLATES[nome]
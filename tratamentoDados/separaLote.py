@@ -0,0 +1,140 @@
+# Tratamento de Dados - Um exemplo de projeto Python
+# Copyright (C) 2024 Vinicius Patriarca Miranda Miguel
+
+# Este programa é software livre: você pode redistribuí-lo e/ou modificá-lo
+# sob os termos da Licença Pública Geral GNU como publicada pela Free Software
+# Foundation, tanto a versão 3 da Licença, como (a seu critério) qualquer versão posterior.
+
+# Este programa é distribuído na esperança de que seja útil,
+# mas SEM NENHUMA GARANTIA; sem mesmo a garantia implícita de
+# COMERCIABILIDADE ou ADEQUAÇÃO A UM DETERMINADO FIM. Veja a
+# Licença Pública Geral GNU para mais detalhes.
+
+# Você deve ter recebido uma cópia da Licença Pública Geral GNU
+# junto com este programa. Se não, veja <https://www.gnu.org/licenses/>.
+
+import argparse
+import json
+import os
+
+from cacheDependencias import DependencyCache, add_force_argument
+from compressao import find_input
+from separajson import (
+    noronha_window,
+    split_code_version,
+    split_json_batch,
+    split_parameters,
+    window_inputs,
+)
+
+
+def load_manifest(manifest_file):
+    # Lê o manifesto: uma lista JSON de simulações, cada uma com o telhado e a
+    # janela de tempo (no horário de Noronha), por exemplo
+    #   {"simulacao": "3", "telhado": "1", "dia_inicio": "2024-07-10",
+    #    "inicio": "16:20", "dia_fim": "2024-07-10", "fim": "18:20"}
+    # O campo opcional "entrada" aponta para a exportação bruta; por padrão é
+    # usado simulacao{N}/telhado{T}/json/Telhado{T}.json.
+    with open(manifest_file, "r") as f:
+        entries = json.load(f)
+
+    # Agrupa as janelas por exportação de entrada
+    batches = {}
+    output_dirs = set()
+    for entry in entries:
+        simulacao = entry["simulacao"]
+        telhado = entry["telhado"]
+        input_file = entry.get("entrada") or find_input(
+            f"simulacao{simulacao}/telhado{telhado}/json/Telhado{telhado}.json"
+        )
+        output_dir = f"simulacao{simulacao}/telhado{telhado}/json"
+        if output_dir in output_dirs:
+            raise ValueError(f"Saída repetida no manifesto: {output_dir}")
+        output_dirs.add(output_dir)
+        start_datetime, end_datetime = noronha_window(
+            entry["dia_inicio"], entry["inicio"], entry["dia_fim"], entry["fim"]
+        )
+        batches.setdefault(os.path.realpath(input_file), []).append(
+            (output_dir, start_datetime, end_datetime)
+        )
+
+    return batches
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Separa várias simulações por tópico lendo cada exportação uma única vez"
+    )
+    parser.add_argument(
+        "--manifesto", "-m", type=str, required=True, help="Arquivo JSON do manifesto"
+    )
+    parser.add_argument(
+        "--compacto",
+        action="store_true",
+        help="Escreve os arquivos de saída sem indentação",
+    )
+    parser.add_argument(
+        "--indice",
+        action="store_true",
+        help="Usa (e cria, se preciso) o índice de tempo de cada exportação",
+    )
+    parser.add_argument(
+        "--processos",
+        "-p",
+        type=int,
+        default=1,
+        help="Número de processos para ler cada exportação em paralelo",
+    )
+    parser.add_argument(
+        "--comprimir",
+        choices=["gz", "xz", "bz2"],
+        help="Escreve os arquivos de cada tópico comprimidos no formato escolhido",
+    )
+    add_force_argument(
+        parser, "Separa todas as janelas, mesmo as que já estão atualizadas"
+    )
+
+    args = parser.parse_args()
+
+    codigo = split_code_version()
+    for input_file, destinations in load_manifest(args.manifesto).items():
+        # Só as janelas cujo trecho da exportação, opções ou código mudaram
+        # são lidas de novo
+        pendentes = []
+        for output_dir, start_datetime, end_datetime in destinations:
+            cache = DependencyCache.from_args(output_dir, args)
+            parametros = split_parameters(
+                start_datetime, end_datetime, args.compacto, args.comprimir
+            )
+            entradas = cache.input_hashes(
+                window_inputs(input_file, start_datetime, end_datetime, args.indice)
+            )
+            if cache.is_up_to_date("separajson", entradas, parametros, codigo):
+                continue
+            pendentes.append(
+                (output_dir, start_datetime, end_datetime, cache, entradas, parametros)
+            )
+
+        print(
+            f"{input_file}: {len(pendentes)} de {len(destinations)} janelas a separar"
+        )
+        if not pendentes:
+            continue
+
+        written = split_json_batch(
+            input_file,
+            [(output_dir, start, end) for output_dir, start, end, *_ in pendentes],
+            args.compacto,
+            args.indice,
+            args.processos,
+            args.comprimir,
+        )
+        for output_dir, _, _, cache, entradas, parametros in pendentes:
+            cache.record(
+                "separajson", entradas, parametros, codigo, written[output_dir]
+            )
+            cache.save()
+
+
+if __name__ == "__main__":
+    main()
@@ -14,42 +14,247 @@
 # junto com este programa. Se não, veja <https://www.gnu.org/licenses/>.
 
 import argparse
+import hashlib
 import json
+import multiprocessing
 import os
+import sys
+import textwrap
+from bisect import bisect_right
+from collections import OrderedDict
 from datetime import datetime
 
 import jsonlines
 import pytz
 
+import compressao as modulo_compressao
+from cacheDependencias import DependencyCache, add_force_argument, code_version
+from compressao import find_input, is_compressed, open_input, open_output
+from indiceJson import load_index, merge_ranges, read_ranges, window_ranges
+from tempo import mongo_date_to_epoch_ms, window_to_epoch_ms
 
-def split_json_by_topic_and_time(input_file, output_dir, start_datetime, end_datetime):
-    # Cria um dicionário para agrupar os dados por tópico
-    grouped_data = {}
+# Número máximo de arquivos de saída abertos simultaneamente no modo em lote
+MAX_OPEN_FILES = 512
 
-    # Define o fuso horário de Londres
-    london_tz = pytz.timezone("Europe/London")
+# Tamanho aproximado (em bytes) de cada pedaço lido por um processo do pool
+DEFAULT_CHUNK_SIZE = 32 * 1024 * 1024
 
-    print(f"Start datetime: {start_datetime}")
-    print(f"End datetime: {end_datetime}")
-    print()
-    print(f"Reading file: {input_file}")
-    print()
+
+def byte_ranges(input_file, windows, usar_indice=False):
+    # Intervalos de bytes da exportação que precisam ser lidos: com o índice de
+    # tempo, apenas os trechos que podem conter alguma das janelas
+    # [start_ms, end_ms]; sem ele, o arquivo inteiro
+    if usar_indice:
+        index = load_index(input_file)
+        return merge_ranges(
+            byte_range
+            for start_ms, end_ms in windows
+            for byte_range in window_ranges(index, start_ms, end_ms)
+        )
+    return [[0, os.path.getsize(input_file)]]
+
+
+def window_inputs(input_file, start_datetime, end_datetime, usar_indice=False):
+    # Entradas de uma janela para o registro de dependências. Com o índice de
+    # tempo vale o hash apenas dos trechos da exportação que podem conter a
+    # janela, de modo que acrescentar uma nova chuva ao fim da exportação não
+    # invalida as janelas anteriores; sem ele, o hash do arquivo inteiro.
+    if not usar_indice or is_compressed(input_file):
+        return [input_file]
+
+    ranges = byte_ranges(
+        input_file, [window_to_epoch_ms(start_datetime, end_datetime)], True
+    )
+    digest = hashlib.sha256()
+    with open(input_file, "rb") as f:
+        for range_start, range_end in ranges:
+            f.seek(range_start)
+            remaining = range_end - range_start
+            while remaining > 0:
+                block = f.read(min(remaining, 1024 * 1024))
+                if not block:
+                    break
+                digest.update(block)
+                remaining -= len(block)
+    return {input_file: digest.hexdigest()}
+
+
+def split_parameters(start_datetime, end_datetime, compacto=False, compressao=None):
+    # Parâmetros que determinam o conteúdo dos arquivos de uma janela
+    return {
+        "inicio": start_datetime.isoformat(),
+        "fim": end_datetime.isoformat(),
+        "compacto": compacto,
+        "compressao": compressao,
+    }
+
+
+def split_code_version():
+    return code_version(sys.modules[__name__], modulo_compressao)
+
+
+def read_records(input_file, windows, usar_indice=False):
+    # Lê os registros da exportação; o chamador continua responsável por
+    # filtrar cada registro pela janela. Exportações comprimidas (.gz, .xz,
+    # .bz2) são descomprimidas em fluxo e lidas do início ao fim.
+    if usar_indice and not is_compressed(input_file):
+        yield from read_ranges(
+            input_file, byte_ranges(input_file, windows, usar_indice)
+        )
+        return
+
+    with open_input(input_file, "rb") as f, jsonlines.Reader(f) as reader:
+        yield from reader
+
+
+def split_chunks(input_file, ranges, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Divide os intervalos de bytes em pedaços de ~chunk_size bytes, com cada
+    # fronteira avançada até o início da linha seguinte
+    chunks = []
+    with open(input_file, "rb") as f:
+        for range_start, range_end in ranges:
+            start = range_start
+            while start < range_end:
+                end = start + chunk_size
+                if end < range_end:
+                    f.seek(end)
+                    f.readline()
+                    end = f.tell()
+                end = min(end, range_end)
+                chunks.append((start, end))
+                start = end
+    return chunks
+
+
+def topic_output_file(output_dir, topic, compressao=None):
+    # Gera o caminho do arquivo de saída a partir do nome do tópico, com a
+    # extensão de compressão opcional (por exemplo ".json.gz")
+    topic_filename = topic.replace("/", "_").replace(" ", "_") + ".json"
+    if compressao:
+        topic_filename += "." + compressao
+    return os.path.join(output_dir, topic_filename)
+
+
+def format_item(item, compacto=False):
+    # Serializa um item no mesmo layout que json.dump(lista, indent=4) produziria
+    # para cada elemento da lista, ou em uma única linha no modo compacto
+    if compacto:
+        return json.dumps(item, separators=(",", ":"))
+    return textwrap.indent(json.dumps(item, indent=4), "    ")
+
+
+class TopicWriter:
+    """Escreve os itens de cada tópico em seu arquivo JSON à medida que são lidos.
+
+    Mantém um arquivo aberto (com buffer) por tópico e escreve o array JSON de
+    forma incremental, de modo que a memória usada não depende do tamanho da
+    exportação. Com max_open, os arquivos menos usados recentemente são
+    fechados e reabertos em modo de acréscimo quando voltam a receber itens.
+    Com compressao ("gz", "xz" ou "bz2") os arquivos são escritos comprimidos.
+    """
+
+    def __init__(
+        self,
+        output_dir,
+        compacto=False,
+        buffer_size=1024 * 1024,
+        max_open=None,
+        compressao=None,
+    ):
+        self.output_dir = output_dir
+        self.compacto = compacto
+        self.buffer_size = buffer_size
+        self.max_open = max_open
+        self.compressao = compressao
+        self.files = OrderedDict()
+        self.counts = {}
+        self.written = []
+
+    def _open(self, topic):
+        f = self.files.get(topic)
+        if f is not None:
+            self.files.move_to_end(topic)
+            return f
+
+        if self.max_open is not None and len(self.files) >= self.max_open:
+            _, oldest = self.files.popitem(last=False)
+            oldest.close()
+
+        if topic in self.counts:
+            mode = "a"
+        else:
+            os.makedirs(self.output_dir, exist_ok=True)
+            mode = "w"
+        f = open_output(self._path(topic), mode + "t", buffering=self.buffer_size)
+        if mode == "w":
+            f.write("[")
+            self.counts[topic] = 0
+        self.files[topic] = f
+        return f
+
+    def _path(self, topic):
+        return topic_output_file(self.output_dir, topic, self.compressao)
+
+    def write(self, topic, item):
+        self.write_text(topic, format_item(item, self.compacto))
+
+    def write_text(self, topic, text):
+        f = self._open(topic)
+        if self.counts[topic]:
+            f.write(",")
+        f.write(text if self.compacto else "\n" + text)
+        self.counts[topic] += 1
+
+    def close(self):
+        for topic in self.counts:
+            f = self.files.pop(topic, None) or open_output(self._path(topic), "at")
+            f.write("]" if self.compacto else "\n]")
+            f.close()
+            self.written.append(self._path(topic))
+            print(f"Salvo: {self._path(topic)}")
+        self.counts = {}
+
+    def discard(self):
+        # Apaga os arquivos incompletos em vez de fechar o array, para que uma
+        # separação interrompida não deixe arquivos que parecem JSON válido
+        for f in self.files.values():
+            f.close()
+        self.files.clear()
+        for topic in self.counts:
+            if os.path.exists(self._path(topic)):
+                os.remove(self._path(topic))
+        self.counts = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+def group_by_topic(input_file, start_datetime, end_datetime, usar_indice=False):
+    # Agrupa em memória os itens da janela por tópico, como {tópico: [itens]},
+    # já sem o campo 'topic'
+    grouped_data = {}
+
+    # Converte o intervalo para milissegundos UTC uma única vez
+    start_ms, end_ms = window_to_epoch_ms(start_datetime, end_datetime)
 
     # Lê o arquivo JSON de entrada linha por linha
-    with jsonlines.open(input_file) as reader:
-        for item in reader:
-            # Converte a string datetime do item para um objeto datetime no fuso horário de Londres
-            item_time = datetime.fromisoformat(
-                item["datetime"]["$date"].replace("Z", "+00:00")
-            ).astimezone(london_tz)
-
-            # Verifica se o item está dentro do intervalo de tempo especificado
-            if start_datetime <= item_time <= end_datetime:
-                topic = item.get("topic")
-                if topic:
-                    if topic not in grouped_data:
-                        grouped_data[topic] = []
-                    grouped_data[topic].append(item)
+    for item in read_records(input_file, [(start_ms, end_ms)], usar_indice):
+        # Converte o datetime do item para milissegundos UTC
+        item_ms = mongo_date_to_epoch_ms(item["datetime"]["$date"])
+
+        # Verifica se o item está dentro do intervalo de tempo especificado
+        if start_ms <= item_ms <= end_ms:
+            topic = item.get("topic")
+            if topic:
+                if topic not in grouped_data:
+                    grouped_data[topic] = []
+                grouped_data[topic].append(item)
 
     # Remove o campo 'topic' do arquivo original
     for item in grouped_data.values():
@@ -57,18 +262,217 @@ def split_json_by_topic_and_time(input_file, output_dir, start_datetime, end_dat
             if "topic" in data:
                 del data["topic"]
 
+    return grouped_data
+
+
+def split_json_by_topic_and_time(
+    input_file,
+    output_dir,
+    start_datetime,
+    end_datetime,
+    compacto=False,
+    usar_indice=False,
+    compressao=None,
+):
+    print(f"Start datetime: {start_datetime}")
+    print(f"End datetime: {end_datetime}")
+    print()
+    print(f"Reading file: {input_file}")
+    print()
+
+    # Agrupa os dados da janela por tópico
+    grouped_data = group_by_topic(input_file, start_datetime, end_datetime, usar_indice)
+
+    return write_topics(grouped_data, output_dir, compacto, compressao)
+
+
+def write_topics(grouped_data, output_dir, compacto=False, compressao=None):
+    # Grava cada tópico de {tópico: [itens]} em seu arquivo JSON e devolve os
+    # arquivos escritos
+
     # Cria o diretório de saída se não existir
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
     # Salva cada grupo em um arquivo JSON separado
+    output_files = []
     for topic, items in grouped_data.items():
-        topic_filename = topic.replace("/", "_").replace(" ", "_") + ".json"
-        output_file = os.path.join(output_dir, topic_filename)
-        with open(output_file, "w") as f:
-            json.dump(items, f, indent=4)
+        output_file = topic_output_file(output_dir, topic, compressao)
+        try:
+            with open_output(output_file, "wt") as f:
+                if compacto:
+                    json.dump(items, f, separators=(",", ":"))
+                else:
+                    json.dump(items, f, indent=4)
+        except BaseException:
+            # Não deixa um arquivo incompleto quando a escrita falha
+            if os.path.exists(output_file):
+                os.remove(output_file)
+            raise
+        output_files.append(output_file)
         print(f"Salvo: {output_file}")
 
+    return output_files
+
+
+def _route_item(item, windows, starts, compacto):
+    # Devolve (tópico, texto serializado, índices das janelas que contêm o item),
+    # ou None se o item não pertencer a nenhuma janela. windows deve estar
+    # ordenada pelo início e starts conter esses inícios.
+    item_ms = mongo_date_to_epoch_ms(item["datetime"]["$date"])
+
+    # Janelas que começam até o instante do item e ainda não terminaram
+    indices = [
+        i for i in range(bisect_right(starts, item_ms)) if item_ms <= windows[i][1]
+    ]
+    if not indices:
+        return None
+
+    topic = item.pop("topic", None)
+    if not topic:
+        return None
+    return topic, format_item(item, compacto), indices
+
+
+def _route_chunk(job):
+    # Executado em um processo do pool: lê e filtra um pedaço da exportação
+    input_file, start, end, windows, compacto = job
+    starts = [start_ms for start_ms, _ in windows]
+
+    with open(input_file, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    routed = []
+    for line in data.split(b"\n"):
+        if line.strip():
+            result = _route_item(json.loads(line), windows, starts, compacto)
+            if result is not None:
+                routed.append(result)
+    return routed
+
+
+def route_records(input_file, windows, compacto=False, usar_indice=False, processos=1):
+    # Gera (tópico, texto, índices das janelas) para cada registro da exportação
+    # que cai em alguma janela, na mesma ordem em que aparecem no arquivo.
+    # Com processos > 1 a exportação é dividida em pedaços alinhados às linhas
+    # e cada pedaço é processado em um processo separado; como os resultados
+    # são consumidos na ordem dos pedaços, a saída é igual à do caminho serial.
+    starts = [start_ms for start_ms, _ in windows]
+
+    # Exportações comprimidas não permitem acesso aleatório aos pedaços
+    if processos > 1 and is_compressed(input_file):
+        print("Entrada comprimida: lendo com um único processo")
+        processos = 1
+
+    if processos <= 1:
+        for item in read_records(input_file, windows, usar_indice):
+            result = _route_item(item, windows, starts, compacto)
+            if result is not None:
+                yield result
+        return
+
+    chunks = split_chunks(input_file, byte_ranges(input_file, windows, usar_indice))
+    jobs = [(input_file, start, end, windows, compacto) for start, end in chunks]
+    with multiprocessing.Pool(processos) as pool:
+        for routed in pool.imap(_route_chunk, jobs):
+            yield from routed
+
+
+def split_json_by_topic_and_time_streaming(
+    input_file,
+    output_dir,
+    start_datetime,
+    end_datetime,
+    compacto=False,
+    usar_indice=False,
+    processos=1,
+    compressao=None,
+):
+    # Versão em fluxo: cada item é escrito no arquivo do seu tópico assim que é
+    # lido, sem acumular os dados em memória
+    start_ms, end_ms = window_to_epoch_ms(start_datetime, end_datetime)
+
+    print(f"Start datetime: {start_datetime}")
+    print(f"End datetime: {end_datetime}")
+    print()
+    print(f"Reading file: {input_file}")
+    print()
+
+    with TopicWriter(output_dir, compacto, compressao=compressao) as writer:
+        for topic, text, _ in route_records(
+            input_file, [(start_ms, end_ms)], compacto, usar_indice, processos
+        ):
+            writer.write_text(topic, text)
+
+    return writer.written
+
+
+def split_json_batch(
+    input_file,
+    destinations,
+    compacto=False,
+    usar_indice=False,
+    processos=1,
+    compressao=None,
+):
+    # Separa uma exportação para várias janelas em uma única leitura.
+    # destinations é uma lista de (output_dir, start_datetime, end_datetime) e
+    # cada registro é enviado para todas as janelas que o contêm. Devolve os
+    # arquivos escritos em cada output_dir.
+    destinations = sorted(
+        (window_to_epoch_ms(start, end), output_dir)
+        for output_dir, start, end in destinations
+    )
+    windows = [window for window, _ in destinations]
+
+    # Limita o total de arquivos abertos ao mesmo tempo entre todas as janelas
+    max_open = max(1, MAX_OPEN_FILES // len(destinations))
+    writers = [
+        TopicWriter(output_dir, compacto, max_open=max_open, compressao=compressao)
+        for _, output_dir in destinations
+    ]
+
+    print(f"Reading file: {input_file} ({len(destinations)} janelas)")
+    print()
+
+    try:
+        for topic, text, indices in route_records(
+            input_file, windows, compacto, usar_indice, processos
+        ):
+            for i in indices:
+                writers[i].write_text(topic, text)
+    except BaseException:
+        for writer in writers:
+            writer.discard()
+        raise
+
+    for writer in writers:
+        writer.close()
+
+    return {
+        output_dir: writer.written
+        for (_, output_dir), writer in zip(destinations, writers)
+    }
+
+
+def noronha_window(start_date, start_time, end_date, end_time):
+    # Converte o intervalo informado no horário de Noronha para o fuso horário
+    # de Londres, usado pelas exportações do broker
+    london_tz = pytz.timezone("Europe/London")
+    noronha_tz = pytz.timezone("America/Noronha")
+
+    start_datetime_sp = noronha_tz.localize(
+        datetime.strptime(f"{start_date} {start_time}", "%Y-%m-%d %H:%M")
+    )
+    end_datetime_sp = noronha_tz.localize(
+        datetime.strptime(f"{end_date} {end_time}", "%Y-%m-%d %H:%M")
+    )
+
+    return start_datetime_sp.astimezone(london_tz), end_datetime_sp.astimezone(
+        london_tz
+    )
+
 
 def main():
     parser = argparse.ArgumentParser(
@@ -106,10 +510,43 @@ def main():
         required=True,
         help="Dia de fim do intervalo (formato: YYYY-MM-DD)",
     )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Escreve cada tópico à medida que o arquivo é lido (memória constante)",
+    )
+    parser.add_argument(
+        "--compacto",
+        action="store_true",
+        help="Escreve os arquivos de saída sem indentação",
+    )
+    parser.add_argument(
+        "--indice",
+        action="store_true",
+        help="Usa (e cria, se preciso) o índice de tempo da exportação para ler só a janela",
+    )
+    parser.add_argument(
+        "--processos",
+        "-p",
+        type=int,
+        default=1,
+        help="Número de processos para ler a exportação em paralelo (implica --streaming)",
+    )
+    parser.add_argument(
+        "--comprimir",
+        choices=["gz", "xz", "bz2"],
+        help="Escreve os arquivos de cada tópico comprimidos no formato escolhido",
+    )
+    add_force_argument(
+        parser, "Separa a janela mesmo que os arquivos já estejam atualizados"
+    )
 
     args = parser.parse_args()
 
-    input_file = f"simulacao{args.simulacao}/telhado{args.telhado}/json/Telhado{args.telhado}.json"
+    # Aceita também a exportação comprimida (Telhado{T}.json.gz, .xz ou .bz2)
+    input_file = find_input(
+        f"simulacao{args.simulacao}/telhado{args.telhado}/json/Telhado{args.telhado}.json"
+    )
     output_dir = f"simulacao{args.simulacao}/telhado{args.telhado}/json"
 
     # Define o intervalo de tempo a partir dos argumentos de linha de comando
@@ -118,25 +555,49 @@ def main():
     start_date = args.dia_inicio
     end_date = args.dia_fim
 
-    # Define os fusos horários de Londres e Noronha
-    london_tz = pytz.timezone("Europe/London")
-    noronha_tz = pytz.timezone("America/Noronha")
+    # Converte o intervalo de Noronha para o fuso horário de Londres
+    start_datetime_ldn, end_datetime_ldn = noronha_window(
+        start_date, start_time, end_date, end_time
+    )
 
-    # Converte os horários de início e fim para datetime no fuso horário de Noronha
-    start_datetime_sp = noronha_tz.localize(
-        datetime.strptime(f"{start_date} {start_time}", "%Y-%m-%d %H:%M")
+    # Pula a separação se a janela, as opções e o código não mudaram
+    cache = DependencyCache.from_args(output_dir, args)
+    entradas = window_inputs(
+        input_file, start_datetime_ldn, end_datetime_ldn, args.indice
     )
-    end_datetime_sp = noronha_tz.localize(
-        datetime.strptime(f"{end_date} {end_time}", "%Y-%m-%d %H:%M")
+    parametros = split_parameters(
+        start_datetime_ldn, end_datetime_ldn, args.compacto, args.comprimir
     )
+    codigo = split_code_version()
+    if cache.is_up_to_date("separajson", entradas, parametros, codigo):
+        print(f"Arquivos atualizados, nada a separar: {output_dir}")
+        return
+    entradas = cache.input_hashes(entradas)
 
-    # Converte os horários de início e fim para o fuso horário de Londres
-    start_datetime_ldn = start_datetime_sp.astimezone(london_tz)
-    end_datetime_ldn = end_datetime_sp.astimezone(london_tz)
+    if args.streaming or args.processos > 1:
+        output_files = split_json_by_topic_and_time_streaming(
+            input_file,
+            output_dir,
+            start_datetime_ldn,
+            end_datetime_ldn,
+            args.compacto,
+            args.indice,
+            args.processos,
+            args.comprimir,
+        )
+    else:
+        output_files = split_json_by_topic_and_time(
+            input_file,
+            output_dir,
+            start_datetime_ldn,
+            end_datetime_ldn,
+            args.compacto,
+            args.indice,
+            args.comprimir,
+        )
 
-    split_json_by_topic_and_time(
-        input_file, output_dir, start_datetime_ldn, end_datetime_ldn
-    )
+    cache.record("separajson", entradas, parametros, codigo, output_files)
+    cache.save()
 
 
 if __name__ == "__main__":
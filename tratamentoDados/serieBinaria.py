@@ -0,0 +1,74 @@
+# Tratamento de Dados - Um exemplo de projeto Python
+# Copyright (C) 2024 Vinicius Patriarca Miranda Miguel
+
+# Este programa é software livre: você pode redistribuí-lo e/ou modificá-lo
+# sob os termos da Licença Pública Geral GNU como publicada pela Free Software
+# Foundation, tanto a versão 3 da Licença, como (a seu critério) qualquer versão posterior.
+
+# Este programa é distribuído na esperança de que seja útil,
+# mas SEM NENHUMA GARANTIA; sem mesmo a garantia implícita de
+# COMERCIABILIDADE ou ADEQUAÇÃO A UM DETERMINADO FIM. Veja a
+# Licença Pública Geral GNU para mais detalhes.
+
+# Você deve ter recebido uma cópia da Licença Pública Geral GNU
+# junto com este programa. Se não, veja <https://www.gnu.org/licenses/>.
+
+import json
+
+import numpy as np
+
+# Layout do arquivo .serie (little-endian):
+#   8 bytes   assinatura MAGIC
+#   8 bytes   tamanho total do cabeçalho (uint64, múltiplo de 64)
+#   JSON      metadados (n, tópico, unidades...), completado com espaços
+#   int64[n]  instantes em milissegundos desde a época (UTC)
+#   float64[n] valores
+MAGIC = b"ICSERIE1"
+SERIES_EXTENSION = ".serie"
+
+_ALIGNMENT = 64
+
+
+def write_series(path, timestamps_ms, values, metadata=None):
+    # Escreve uma série em formato colunar binário
+    timestamps_ms = np.ascontiguousarray(timestamps_ms, dtype="<i8")
+    values = np.ascontiguousarray(values, dtype="<f8")
+    if timestamps_ms.shape != values.shape or timestamps_ms.ndim != 1:
+        raise ValueError("Instantes e valores devem ser vetores do mesmo tamanho")
+
+    metadata = dict(metadata or {})
+    metadata.update({"versao": 1, "n": len(values), "unidade_tempo": "ms"})
+    meta_bytes = json.dumps(metadata).encode()
+
+    header_len = -(-(16 + len(meta_bytes)) // _ALIGNMENT) * _ALIGNMENT
+    header = MAGIC + np.uint64(header_len).astype("<u8").tobytes() + meta_bytes
+    header += b" " * (header_len - len(header))
+
+    with open(path, "wb") as f:
+        f.write(header)
+        f.write(timestamps_ms.tobytes())
+        f.write(values.tobytes())
+
+
+def read_metadata(path):
+    # Lê apenas o cabeçalho; retorna (metadados, tamanho do cabeçalho)
+    with open(path, "rb") as f:
+        start = f.read(16)
+        if start[:8] != MAGIC:
+            raise ValueError(f"{path} não é um arquivo de série")
+        header_len = int(np.frombuffer(start[8:], dtype="<u8")[0])
+        metadata = json.loads(f.read(header_len - 16))
+    return metadata, header_len
+
+
+def open_series(path):
+    # Abre a série com numpy.memmap, sem copiar nem interpretar os dados;
+    # retorna (instantes em ms, valores, metadados)
+    metadata, header_len = read_metadata(path)
+    n = metadata["n"]
+    if n == 0:
+        return np.empty(0, dtype="<i8"), np.empty(0, dtype="<f8"), metadata
+
+    timestamps_ms = np.memmap(path, dtype="<i8", mode="r", offset=header_len, shape=n)
+    values = np.memmap(path, dtype="<f8", mode="r", offset=header_len + 8 * n, shape=n)
+    return timestamps_ms, values, metadata
@@ -0,0 +1,72 @@
+# Tratamento de Dados - Um exemplo de projeto Python
+# Copyright (C) 2024 Vinicius Patriarca Miranda Miguel
+
+# Este programa é software livre: você pode redistribuí-lo e/ou modificá-lo
+# sob os termos da Licença Pública Geral GNU como publicada pela Free Software
+# Foundation, tanto a versão 3 da Licença, como (a seu critério) qualquer versão posterior.
+
+# Este programa é distribuído na esperança de que seja útil,
+# mas SEM NENHUMA GARANTIA; sem mesmo a garantia implícita de
+# COMERCIABILIDADE ou ADEQUAÇÃO A UM DETERMINADO FIM. Veja a
+# Licença Pública Geral GNU para mais detalhes.
+
+# Você deve ter recebido uma cópia da Licença Pública Geral GNU
+# junto com este programa. Se não, veja <https://www.gnu.org/licenses/>.
+
+import calendar
+from datetime import datetime, timezone
+
+# Cache de dias desde a época por prefixo "YYYY-MM-DD" (os registros de uma
+# exportação se concentram em poucos dias)
+_epoch_days = {}
+
+
+def _days_from_civil(year, month, day):
+    # Número de dias desde 1970-01-01 no calendário gregoriano proléptico
+    year -= month <= 2
+    era = (year if year >= 0 else year - 399) // 400
+    yoe = year - era * 400
+    doy = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+def mongo_date_to_epoch_ms(date):
+    # Converte o campo "$date" da exportação do Mongo para milissegundos desde a
+    # época (UTC). O formato fixo "YYYY-MM-DDTHH:MM:SS.mmmZ" é lido por fatiamento,
+    # sem criar objetos datetime; outros formatos usam o caminho genérico.
+    if type(date) is str and len(date) == 24 and date[23] == "Z" and date[19] == ".":
+        days = _epoch_days.get(date[:10])
+        if days is None:
+            days = _days_from_civil(int(date[:4]), int(date[5:7]), int(date[8:10]))
+            _epoch_days[date[:10]] = days
+        seconds = (
+            days * 86400
+            + int(date[11:13]) * 3600
+            + int(date[14:16]) * 60
+            + int(date[17:19])
+        )
+        return seconds * 1000 + int(date[20:23])
+
+    if isinstance(date, dict):
+        # Datas fora do intervalo ISO são exportadas como {"$numberLong": "..."}
+        return int(date["$numberLong"])
+
+    dt = datetime.fromisoformat(date.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return datetime_to_epoch_ms(dt)
+
+
+def datetime_to_epoch_ms(dt):
+    # Converte um datetime com fuso horário para milissegundos desde a época
+    return calendar.timegm(dt.utctimetuple()) * 1000 + dt.microsecond // 1000
+
+
+def window_to_epoch_ms(start_datetime, end_datetime):
+    # Limites inteiros equivalentes ao intervalo fechado [início, fim]: o início
+    # é arredondado para cima e o fim para baixo ao milissegundo
+    start_ms = datetime_to_epoch_ms(start_datetime)
+    if start_datetime.microsecond % 1000:
+        start_ms += 1
+    return start_ms, datetime_to_epoch_ms(end_datetime)
@@ -0,0 +1,64 @@
+# Tratamento de Dados - Um exemplo de projeto Python
+# Copyright (C) 2024 Vinicius Patriarca Miranda Miguel
+
+# Este programa é software livre: você pode redistribuí-lo e/ou modificá-lo
+# sob os termos da Licença Pública Geral GNU como publicada pela Free Software
+# Foundation, tanto a versão 3 da Licença, como (a seu critério) qualquer versão posterior.
+
+# Este programa é distribuído na esperança de que seja útil,
+# mas SEM NENHUMA GARANTIA; sem mesmo a garantia implícita de
+# COMERCIABILIDADE ou ADEQUAÇÃO A UM DETERMINADO FIM. Veja a
+# Licença Pública Geral GNU para mais detalhes.
+
+# Você deve ter recebido uma cópia da Licença Pública Geral GNU
+# junto com este programa. Se não, veja <https://www.gnu.org/licenses/>.
+
+import numpy as np
+import pandas as pd
+
+from eventosChuva import roof_volumes, simulation_events
+
+
+def _write_csv(path, data, body):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame({"data": data, "body": body}).to_csv(path, index=False)
+
+
+def test_roof_volumes_firmware_topics(tmp_path, monkeypatch):
+    # Tópicos com o prefixo do firmware: o volume do telhado 1 vem do tópico
+    # de volume e o do telhado 2, do nível vezes a área do galão (raio padrão)
+    monkeypatch.chdir(tmp_path)
+    df = pd.DataFrame(
+        {
+            "data": pd.date_range("2024-07-10 18:00", periods=3, freq="min"),
+            "telhado1/ic_escoamentoTelhado-1_Volume(cm3)": [1.0, 2.0, 3.0],
+            "telhado1/ic_escoamentoTelhado-1_NivelAgua(cm)": [9.0, 9.0, 9.0],
+            "telhado2/ic_escoamentoTelhado-2_NivelAgua(cm)": [1.0, 2.0, 3.0],
+            "telhado2/ic_escoamentoTelhado-2_NivelAguaCorrigido(cm)": [7.0] * 3,
+        }
+    )
+
+    volumes = roof_volumes("1", df)
+
+    assert list(volumes) == ["1", "2"]
+    np.testing.assert_allclose(volumes["1"], [1.0, 2.0, 3.0])
+    np.testing.assert_allclose(volumes["2"], np.array([1.0, 2.0, 3.0]) * np.pi * 900)
+
+
+def test_simulation_events_firmware_topics(tmp_path, monkeypatch):
+    # Uma chuva entre 18:10 e 18:19 enche o galão do telhado 1
+    monkeypatch.chdir(tmp_path)
+    csv_dir = tmp_path / "simulacao1" / "telhado1" / "csv"
+    data = [f"18:{minuto:02d}" for minuto in range(60)]
+    chuva = [1.0 if 10 <= minuto < 20 else 0.0 for minuto in range(60)]
+    volume = np.cumsum(chuva) * 100.0
+    _write_csv(csv_dir / "ic_pluviometro_Chuva_Milimetros(mm).csv", data, chuva)
+    _write_csv(csv_dir / "ic_escoamentoTelhado-1_Volume(cm3).csv", data, volume)
+
+    tabela = simulation_events("1", seca=30)
+
+    assert len(tabela) == 1
+    evento = tabela.iloc[0]
+    assert evento["telhado"] == "1"
+    assert evento["chuva(mm)"] == 10.0
+    assert evento["volume_escoado(cm3)"] == 1000.0